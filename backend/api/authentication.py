@@ -0,0 +1,111 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.authentication import TokenAuthentication
+
+from core.cache import bump_version_on_commit, get_version, is_shared
+
+
+def get_auth_version_key(user_id):
+    return f'auth:version:{user_id}'
+
+
+def invalidate_user_tokens(user_id):
+    """
+    Сбрасывает закэшированные токены пользователя во всех процессах
+    после фиксации текущей транзакции.
+    """
+    bump_version_on_commit(get_auth_version_key(user_id))
+
+
+def dump(instance):
+    return type(instance), tuple(
+        getattr(instance, field.attname)
+        for field in instance._meta.concrete_fields
+    )
+
+
+def load(data):
+    """Новый экземпляр модели, не разделяющий состояние с другими."""
+    model, values = data
+    return model.from_db(DEFAULT_DB_ALIAS, [
+        field.attname for field in model._meta.concrete_fields
+    ], values)
+
+
+class TokenCache:
+    """
+    Ограниченный LRU-кэш `токен -> (пользователь, токен)` в памяти
+    процесса. Запись действительна `timeout` секунд и пока версия
+    пользователя в общем кэше не изменилась. Хранятся значения полей,
+    каждый запрос получает свои экземпляры моделей.
+    """
+    def __init__(self, max_size, timeout):
+        self._lock = Lock()
+        self._entries = OrderedDict()
+        self.max_size = max_size
+        self.timeout = timeout
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+        user_data, token_data, version, expires = entry
+        user = load(user_data)
+        if (
+            expires < monotonic()
+            or version != get_version(get_auth_version_key(user.pk))
+        ):
+            self.delete(key)
+            return None
+        token = load(token_data)
+        token.user = user
+        return user, token
+
+    def set(self, key, user, token, version):
+        with self._lock:
+            self._entries[key] = (
+                dump(user), dump(token), version,
+                monotonic() + self.timeout,
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache(
+    settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TIMEOUT,
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Аутентификация по токену без запроса к БД для недавно
+    проверенных токенов. Кэш сбрасывается при выходе, смене пароля
+    и деактивации пользователя (см. `api.signals`). Сброс доходит
+    до других процессов только через общий кэш, поэтому с кэшем
+    в памяти процесса каждый токен проверяется по БД.
+    """
+    def authenticate_credentials(self, key):
+        if not is_shared():
+            return super().authenticate_credentials(key)
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+        user, token = super().authenticate_credentials(key)
+        version = get_version(get_auth_version_key(user.pk))
+        token_cache.set(key, user, token, version)
+        return user, token
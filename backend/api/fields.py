@@ -1,16 +1,70 @@
 import base64
+import binascii
 
+from django.conf import settings
 from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import TemporaryUploadedFile
 from rest_framework import serializers
 
+# Длина порции base64 кратна 4, чтобы каждая декодировалась отдельно.
+DECODE_CHUNK_SIZE = 4 * 16 * 1024
+
+
+def decoded_size(imgstr):
+    """Размер данных после декодирования base64, без самого декодирования."""
+    return len(imgstr) * 3 // 4 - imgstr[-2:].count('=')
+
 
 class Base64ImageField(serializers.ImageField):
-    """Декодирование изображение."""
+    """
+    Декодирование изображение.
+    Размер проверяется до декодирования, большие изображения
+    декодируются по частям во временный файл, а не в память.
+    """
+    default_error_messages = {
+        **serializers.ImageField.default_error_messages,
+        'too_large': 'Изображение больше {max_size} байт.',
+    }
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
+            try:
+                format, imgstr = data.split(';base64,')
+            except ValueError:
+                self.fail('invalid_image')
             ext = format.split('/')[-1]
-
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            size = decoded_size(imgstr)
+            if size > settings.IMAGE_MAX_UPLOAD_SIZE:
+                self.fail('too_large', max_size=settings.IMAGE_MAX_UPLOAD_SIZE)
+            try:
+                data = self.decode(imgstr, 'temp.' + ext, size)
+            except binascii.Error:
+                self.fail('invalid_image')
 
         return super().to_internal_value(data)
+
+    def decode(self, imgstr, name, size):
+        if size <= settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+            return ContentFile(
+                base64.b64decode(imgstr, validate=True), name=name,
+            )
+        file = TemporaryUploadedFile(name, 'image', size, None)
+        for start in range(0, len(imgstr), DECODE_CHUNK_SIZE):
+            file.write(base64.b64decode(
+                imgstr[start:start + DECODE_CHUNK_SIZE], validate=True,
+            ))
+        file.seek(0)
+        return file
+
+
+class ResizedImageField(serializers.ImageField):
+    """
+    Ссылка на уменьшенную копию изображения рецепта.
+    Пока копия готовится в фоне, отдаётся ссылка на оригинал.
+    """
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        return super().get_attribute(instance) or instance.image
@@ -1,41 +1,93 @@
-from django_filters import ModelMultipleChoiceFilter
 from django_filters.rest_framework import FilterSet, filters
-from rest_framework.filters import SearchFilter
 
-from recipes.models import Recipe, Tag
+from api.relations import get_relations
+from core.enums import Limits
+from recipes.indexes import tag_registry
+from recipes.models import Favorite, Recipe, ShoppingCart
+from recipes.search import search_recipes
 from users.models import User
 
+POPULAR = 'popular'
+TRENDING = 'trending'
+ORDERINGS = {
+    POPULAR: ('-favorites_count', '-pub_date'),
+    TRENDING: ('-trending_score', '-pub_date'),
+}
+ORDERING_CHOICES = (
+    (POPULAR, 'Популярные'),
+    (TRENDING, 'Набирающие популярность'),
+)
 
-class IngredientSearchFilter(SearchFilter):
-    """Поиск ингредиента по имени."""
-    search_param = 'name'
+
+def get_tag_choices():
+    return tag_registry.choices()
 
 
 class RecipeFilter(FilterSet):
     """
     Доступна фильтрация по избранному, автору, списку покупок и тегам.
+    `?ordering=popular` сортирует по числу добавлений в избранное,
+    `?ordering=trending` - по рейтингу недавних добавлений, рецепты
+    без рейтинга идут после них по дате публикации.
+    `?search=` ищет по названию, ингредиентам и описанию
+    и сортирует по релевантности, если не задан `ordering`.
     """
-    tags = ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all(),
+    tags = filters.MultipleChoiceFilter(
+        choices=get_tag_choices,
+        method='filter_tags',
     )
     author = filters.ModelChoiceFilter(queryset=User.objects.all())
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart',
     )
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(
+        choices=ORDERING_CHOICES,
+        method='filter_ordering',
+    )
 
     class Meta:
         model = Recipe
         fields = ('tags', 'author')
 
+    def filter_tags(self, queryset, name, value):
+        """
+        Slug проверяются и переводятся в id по реестру тегов,
+        поэтому таблица тегов в запрос не попадает.
+        """
+        return queryset.filter(
+            tags__in=tag_registry.get_ids(value)
+        ).distinct()
+
+    def filter_related(self, queryset, model, recipe_ids):
+        """
+        Рецепты из связей пользователя. Небольшое множество id
+        подставляется в запрос списком, большое - подзапросом,
+        чтобы не упереться в ограничение числа параметров SQLite.
+        """
+        if len(recipe_ids) <= Limits.MAX_FILTER_IDS:
+            return queryset.filter(pk__in=recipe_ids)
+        return queryset.filter(pk__in=model.objects.filter(
+            user=self.request.user,
+        ).values('recipe_id'))
+
     def filter_is_favorited(self, queryset, name, value):
         if value:
-            return queryset.filter(in_favorites__user=self.request.user)
+            return self.filter_related(
+                queryset, Favorite, get_relations(self.request).favorites,
+            )
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         if value:
-            return queryset.filter(in_carts__user=self.request.user)
+            return self.filter_related(
+                queryset, ShoppingCart, get_relations(self.request).cart,
+            )
         return queryset
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value, self.request)
+
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by(*ORDERINGS[value])
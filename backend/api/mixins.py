@@ -0,0 +1,84 @@
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import parse_etags
+from rest_framework.response import Response
+from rest_framework.status import HTTP_304_NOT_MODIFIED
+
+from core.cache import get_version
+from core.db_router import use_primary
+from recipes.indexes import make_etag
+
+
+class AnonymousCacheMixin:
+    """
+    Кэширует ответы `list` и `retrieve` для анонимных пользователей.
+    Ключ строится по адресу запроса и версии данных
+    `cache_version_key`, поэтому после изменения данных
+    закэшированные страницы больше не используются. Кэшируемый ответ
+    строится по основной БД: реплика может ещё не видеть изменений.
+    Ответы с параметрами из `uncached_params` не кэшируются: данные,
+    от которых они зависят, меняются без смены версии.
+    """
+    cache_version_key = None
+    cache_timeout = settings.RESPONSE_CACHE_TIMEOUT
+    # Пары (параметр запроса, значение).
+    uncached_params = ()
+
+    def is_cacheable(self, request):
+        return request.user.is_anonymous and not any(
+            value in request.query_params.getlist(param)
+            for param, value in self.uncached_params
+        )
+
+    def get_cache_key(self, request):
+        query = sorted(request.query_params.lists())
+        url = f'{request.get_host()}{request.path}?{query}'
+        return (
+            f'response:{self.cache_version_key}:'
+            f'{get_version(self.cache_version_key)}:'
+            f'{md5(url.encode()).hexdigest()}'
+        )
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return handler(request, *args, **kwargs)
+        key = self.get_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        with use_primary():
+            response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, self.cache_timeout)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+
+class ETagMixin:
+    """
+    Отдаёт сильный ETag и отвечает 304 Not Modified, если клиент
+    прислал его в If-None-Match. `etag` описывает данные, к нему
+    добавляется формат ответа.
+    """
+    def get_etag_response(self, request, get_data, etag):
+        etag = make_etag(etag, request.accepted_renderer.format)
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match and (
+            etag in parse_etags(if_none_match) or if_none_match == '*'
+        ):
+            response = Response(status=HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(get_data())
+        response['ETag'] = etag
+        return response
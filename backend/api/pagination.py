@@ -1,4 +1,23 @@
-from rest_framework.pagination import PageNumberPagination
+from base64 import b64decode, b64encode
+from binascii import Error as BinasciiError
+from datetime import datetime
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    BasePagination,
+    CursorPagination,
+    PageNumberPagination,
+)
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from core.enums import Limits
+
+PAGINATION_QUERY_PARAM = 'pagination'
+CURSOR_PAGINATION = 'cursor'
+# Параметры, которые задают свою сортировку вместо `pub_date`.
+ORDERING_QUERY_PARAMS = ('ordering', 'search')
 
 
 class CustomPagination(PageNumberPagination):
@@ -7,3 +26,116 @@ class CustomPagination(PageNumberPagination):
     `page_size_query_param`, для вывода запрошенного количества страниц.
     """
     page_size_query_param = 'limit'
+
+
+class RecipeCursorPagination(CursorPagination):
+    """
+    Курсорная пагинация ленты рецептов по индексу `pub_date`.
+    Не выполняет COUNT(*) и OFFSET, поэтому глубокие страницы
+    отдаются так же быстро, как первая.
+    """
+    page_size_query_param = 'limit'
+    ordering = ('-pub_date', '-id')
+
+
+class FollowCursorPagination(RecipeCursorPagination):
+    """Курсорная пагинация подписок в порядке их создания."""
+    ordering = ('id', )
+
+
+class FeedPagination(BasePagination):
+    """
+    Пагинация ленты подписок по ключу (дата публикации, id рецепта)
+    последнего рецепта страницы. Страница строится
+    `FeedItem.objects.get_page`, сам пагинатор только разбирает
+    и собирает курсор.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = Limits.MAX_FEED_PAGE_SIZE.value
+    invalid_cursor_message = 'Неверный курсор'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            pub_date, recipe_id = b64decode(
+                cursor.encode('ascii'), validate=True,
+            ).decode('ascii').split('|')
+            return datetime.fromisoformat(pub_date), int(recipe_id)
+        except (BinasciiError, UnicodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, pub_date, recipe_id):
+        return b64encode(
+            f'{pub_date.isoformat()}|{recipe_id}'.encode('ascii')
+        ).decode('ascii')
+
+    def paginate_feed(self, get_page, request):
+        """
+        Вызывает `get_page(limit, before)` и возвращает пары
+        (id рецепта, дата публикации) текущей страницы.
+        """
+        self.request = request
+        page_size = self.get_page_size(request)
+        page = get_page(page_size + 1, self.decode_cursor(request))
+        self.has_next = len(page) > page_size
+        page = page[:page_size]
+        self.last = page[-1] if page else None
+        return page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        recipe_id, pub_date = self.last
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(pub_date, recipe_id),
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': None,
+            'results': data,
+        })
+
+
+class SwitchablePaginationMixin:
+    """
+    Позволяет клиенту выбрать курсорную пагинацию параметром
+    `?pagination=cursor`. По умолчанию используется `pagination_class`,
+    он же остаётся, если `cursor_pagination_class` не задан или
+    клиент выбрал другую сортировку параметром `?ordering=`
+    или `?search=`.
+    """
+    cursor_pagination_class = RecipeCursorPagination
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            pagination_class = self.pagination_class
+            if (
+                self.cursor_pagination_class is not None
+                and self.request.query_params.get(PAGINATION_QUERY_PARAM)
+                == CURSOR_PAGINATION
+                and not any(
+                    param in self.request.query_params
+                    for param in ORDERING_QUERY_PARAMS
+                )
+            ):
+                pagination_class = self.cursor_pagination_class
+            self._paginator = pagination_class() if pagination_class else None
+        return self._paginator
@@ -0,0 +1,80 @@
+"""
+Связи текущего пользователя с рецептами и авторами: избранное,
+список покупок и подписки. Загружаются один раз на запрос
+и хранятся в общем кэше до изменения этих связей. Сброс версии
+доходит до других процессов только через общий кэш, поэтому
+с кэшем в памяти процесса связи читаются из БД в каждом запросе.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from core.cache import bump_version_on_commit, get_version, is_shared
+from core.db_router import use_primary
+from recipes.models import Favorite, ShoppingCart
+from users.models import Follow
+
+REQUEST_ATTRIBUTE = '_user_relations'
+
+
+class UserRelations:
+    """Множества id рецептов и авторов, связанных с пользователем."""
+    def __init__(self, favorites=(), cart=(), following=()):
+        self.favorites = frozenset(favorites)
+        self.cart = frozenset(cart)
+        self.following = frozenset(following)
+
+
+EMPTY_RELATIONS = UserRelations()
+
+
+def get_version_key(user_id):
+    return f'relations:version:{user_id}'
+
+
+def read_relations(user_id):
+    """Связи пользователя из основной БД."""
+    with use_primary():
+        return (
+            list(Favorite.objects.filter(
+                user_id=user_id
+            ).values_list('recipe_id', flat=True)),
+            list(ShoppingCart.objects.filter(
+                user_id=user_id
+            ).values_list('recipe_id', flat=True)),
+            list(Follow.objects.filter(
+                user_id=user_id
+            ).values_list('author_id', flat=True)),
+        )
+
+
+def load_relations(user_id):
+    """
+    Читает связи из общего кэша или из основной БД. Версия читается
+    до запроса к БД, поэтому данные, прочитанные одновременно
+    с изменением, сохраняются под уже устаревшей версией.
+    """
+    if not is_shared():
+        return UserRelations(*read_relations(user_id))
+    version = get_version(get_version_key(user_id))
+    key = f'relations:{user_id}:{version}'
+    data = cache.get(key)
+    if data is None:
+        data = read_relations(user_id)
+        cache.set(key, data, settings.RELATIONS_CACHE_TIMEOUT)
+    return UserRelations(*data)
+
+
+def get_relations(request):
+    """Связи пользователя запроса, один раз за запрос."""
+    if request is None or not request.user.is_authenticated:
+        return EMPTY_RELATIONS
+    relations = getattr(request, REQUEST_ATTRIBUTE, None)
+    if relations is None:
+        relations = load_relations(request.user.pk)
+        setattr(request, REQUEST_ATTRIBUTE, relations)
+    return relations
+
+
+def invalidate_relations(user_id):
+    """Сбрасывает связи пользователя после фиксации транзакции."""
+    bump_version_on_commit(get_version_key(user_id))
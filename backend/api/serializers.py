@@ -1,28 +1,39 @@
-from api.fields import Base64ImageField
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+
+from api.fields import Base64ImageField, ResizedImageField
+from api.relations import get_relations
 from rest_framework.serializers import (
+    FloatField,
     IntegerField,
+    ListField,
     ModelSerializer,
-    PrimaryKeyRelatedField,
     ReadOnlyField,
     Serializer,
     SerializerMethodField,
 )
 
+from core.counters import change_counter
+from core.enums import Limits
 from core.validators import (
     validate_ingredients,
     validate_tags,
     validate_time,
 )
+from recipes.indexes import tag_registry
 from recipes.models import (
     Favorite,
     Ingredient,
     IngredientAmount,
     Recipe,
     Tag,
-    ShoppingCart,
+    ShoppingCartTotal,
 )
+from users.models import User
 from users.serializers import CustomUserSerializer, ShortRecipeSerializer
 
+DEFAULT_MIN_COVERAGE = 0.5
+
 
 class TagsSerializer(ModelSerializer):
     """Сериализатор для вывода тегов."""
@@ -54,8 +65,12 @@ class IngredientAmountSerializer(ModelSerializer):
 
 
 class AddIngredientSerializer(Serializer):
-    """Сериализатор для добавления ингредиентов."""
-    id = PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    """
+    Сериализатор для добавления ингредиентов.
+    Наличие ингредиентов в БД проверяется в `validate_ingredients`
+    одним запросом для всего рецепта.
+    """
+    id = IntegerField()
     amount = IntegerField()
 
 
@@ -63,8 +78,10 @@ class RecipeGetSerializer(ModelSerializer):
     """Сериализатор для отображения рецептов."""
     author = CustomUserSerializer(read_only=True)
     ingredients = SerializerMethodField(read_only=True)
-    tags = TagsSerializer(many=True, read_only=True)
+    tags = SerializerMethodField(read_only=True)
     image = Base64ImageField()
+    image_thumbnail = ResizedImageField()
+    image_card = ResizedImageField()
     is_favorited = SerializerMethodField()
     is_in_shopping_cart = SerializerMethodField()
 
@@ -79,6 +96,8 @@ class RecipeGetSerializer(ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_thumbnail',
+            'image_card',
             'text',
             'cooking_time',
         )
@@ -86,29 +105,66 @@ class RecipeGetSerializer(ModelSerializer):
 
     def get_ingredients(self, obj):
         """Получаем все ингридиенты рецепта."""
-        queryset = IngredientAmount.objects.filter(recipe=obj).all()
-        return IngredientAmountSerializer(queryset, many=True).data
+        return IngredientAmountSerializer(
+            obj.ingredient.all(), many=True
+        ).data
+
+    def get_tags(self, obj):
+        """
+        Теги рецепта из реестра тегов. Если реестр отстал и какого-то
+        тега в нём нет, все теги читаются одним запросом на ответ.
+        """
+        tags = [tag_registry.get(tag.id) for tag in obj.tags.all()]
+        if None not in tags:
+            return tags
+        if not hasattr(self, '_loaded_tags'):
+            self._loaded_tags = {
+                tag['id']: tag
+                for tag in Tag.objects.values('id', 'name', 'color', 'slug')
+            }
+        return [
+            self._loaded_tags[tag.id] for tag in obj.tags.all()
+            if tag.id in self._loaded_tags
+        ]
 
-    def get_presence(self, model, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return model.objects.filter(user=user, recipe=obj).exists()
+    def get_relations(self):
+        return get_relations(self.context.get('request'))
 
     def get_is_favorited(self, obj):
         """Статус - рецепт в избранном или нет."""
-        return self.get_presence(Favorite, obj)
+        return obj.id in self.get_relations().favorites
 
     def get_is_in_shopping_cart(self, obj):
         """Статус - рецепт в списке покупок или нет."""
-        return self.get_presence(ShoppingCart, obj)
+        return obj.id in self.get_relations().cart
+
+
+class RecipeMatchSerializer(RecipeGetSerializer):
+    """Рецепт с долей ингредиентов, которые уже есть у пользователя."""
+    coverage = FloatField(read_only=True)
+
+    class Meta(RecipeGetSerializer.Meta):
+        fields = RecipeGetSerializer.Meta.fields + ('coverage', )
+
+
+class IngredientMatchSerializer(Serializer):
+    """
+    Имеющиеся ингредиенты и минимальная доля ингредиентов рецепта,
+    которые должны среди них найтись.
+    """
+    ingredients = ListField(
+        child=IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=Limits.MAX_MATCH_INGREDIENTS.value,
+    )
+    min_coverage = FloatField(
+        min_value=0, max_value=1, default=DEFAULT_MIN_COVERAGE,
+    )
 
 
 class RecipeChangeSerializer(ModelSerializer):
     """Сериализатор для добавления рецепта."""
-    tags = PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(), many=True,
-    )
+    tags = ListField(child=IntegerField())
     ingredients = AddIngredientSerializer(many=True)
     image = Base64ImageField()
 
@@ -125,6 +181,8 @@ class RecipeChangeSerializer(ModelSerializer):
 
     def add_ingredients(self, ingredients_list, recipe):
         """Создание уникальных записей: ингредиент - рецепт - количество."""
+        if not ingredients_list:
+            return
         IngredientAmount.objects.bulk_create([
             IngredientAmount(
                 recipe=recipe,
@@ -134,42 +192,113 @@ class RecipeChangeSerializer(ModelSerializer):
         ])
 
     def validate(self, data):
-        validate_tags(self.initial_data.get('tags')),
-        validate_ingredients(
-            self.initial_data.get('ingredients')
+        data['tags'] = validate_tags(data.get('tags'))
+        data['ingredients'] = validate_ingredients(
+            data.get('ingredients')
         )
         validate_time(
-            self.initial_data.get('cooking_time')
+            data.get('cooking_time')
         )
         return data
 
-    def create_tags(self, data, recipe):
-        """Отправка на валидацию и создание тэгов у рецепта."""
-        for tag in data:
-            recipe.tags.add(tag)
+    def save(self, **kwargs):
+        """
+        Закрывает временный файл декодированного изображения:
+        хранилище перемещает его, и удалять на диске уже нечего.
+        """
+        try:
+            return super().save(**kwargs)
+        finally:
+            image = self.validated_data.get('image')
+            if image is not None:
+                image.close()
 
+    @transaction.atomic
     def create(self, validated_data):
         author = self.context.get('request').user
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(author=author, **validated_data)
-        self.create_tags(tags, recipe)
+        recipe.tags.set(tags)
         self.add_ingredients(ingredients, recipe)
+        change_counter(User, author.pk, 'recipes_count')
         return recipe
 
     def to_representation(self, instance):
         request = self.context.get('request')
         context = {'request': request}
+        prefetch_related_objects(
+            [instance],
+            'tags',
+            Prefetch(
+                'ingredient',
+                queryset=IngredientAmount.objects.select_related('ingredient'),
+            ),
+        )
         return RecipeGetSerializer(instance, context=context).data
 
+    def update_ingredients(self, ingredients_list, recipe):
+        """
+        Приводит ингредиенты рецепта к новому списку, меняя только
+        отличающиеся записи. Возвращает прежние и новые количества.
+        """
+        current = {
+            ingredient_amount.ingredient_id: ingredient_amount
+            for ingredient_amount in IngredientAmount.objects.filter(
+                recipe=recipe
+            )
+        }
+        old_amounts = {
+            ingredient_id: ingredient_amount.amount
+            for ingredient_id, ingredient_amount in current.items()
+        }
+        new_amounts = {
+            ingredient['id'].id: ingredient['amount']
+            for ingredient in ingredients_list
+        }
+        removed = old_amounts.keys() - new_amounts.keys()
+        if removed:
+            IngredientAmount.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        changed = []
+        for ingredient_id, amount in new_amounts.items():
+            ingredient_amount = current.get(ingredient_id)
+            if ingredient_amount and ingredient_amount.amount != amount:
+                ingredient_amount.amount = amount
+                changed.append(ingredient_amount)
+        if changed:
+            IngredientAmount.objects.bulk_update(changed, ['amount'])
+        self.add_ingredients(
+            [
+                ingredient for ingredient in ingredients_list
+                if ingredient['id'].id not in current
+            ],
+            recipe,
+        )
+        return old_amounts, new_amounts
+
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.tags.clear()
-        IngredientAmount.objects.filter(recipe=instance).delete()
-        self.create_tags(validated_data.pop('tags'), instance)
-        self.add_ingredients(validated_data.pop('ingredients'), instance)
+        instance.tags.set(validated_data.pop('tags'))
+        old_amounts, new_amounts = self.update_ingredients(
+            validated_data.pop('ingredients'), instance
+        )
+        ShoppingCartTotal.objects.change_recipe(
+            instance, old_amounts, new_amounts
+        )
         return super().update(instance, validated_data)
 
 
+class RecipeIdsSerializer(Serializer):
+    """Список id рецептов для пакетных операций."""
+    ids = ListField(
+        child=IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=Limits.MAX_BATCH_RECIPES.value,
+    )
+
+
 class FavoriteSerializer(ModelSerializer):
     """
     Сериализатор для списка избранного
@@ -0,0 +1,96 @@
+from django.db.models.signals import (
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import invalidate_user_tokens
+from api.relations import invalidate_relations
+from api.utlis import RECIPE_COUNTERS
+from core.cache import bump_version_on_commit
+from core.counters import change_counter, change_counters
+from recipes.indexes import RECIPES_VERSION_KEY
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Follow, User
+
+# Поля профиля автора в ответах с рецептами.
+AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name')
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(instance, **kwargs):
+    """Выход через `token/logout` удаляет токен пользователя."""
+    invalidate_user_tokens(instance.user_id)
+
+
+@receiver((post_save, post_delete), sender=User)
+def invalidate_user(instance, update_fields=None, **kwargs):
+    """
+    Смена пароля, деактивация и другие изменения пользователя.
+    Обновление только `last_login` при входе кэш не сбрасывает.
+    """
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    invalidate_user_tokens(instance.pk)
+
+
+@receiver(pre_save, sender=User)
+def check_author_changes(instance, update_fields=None, **kwargs):
+    """Запоминает, изменились ли поля автора, показываемые в рецептах."""
+    instance._author_changed = False
+    if instance._state.adding or (
+        update_fields is not None
+        and not set(update_fields) & set(AUTHOR_FIELDS)
+    ):
+        return
+    previous = User.objects.filter(pk=instance.pk).values_list(
+        *AUTHOR_FIELDS
+    ).first()
+    instance._author_changed = previous != tuple(
+        getattr(instance, field) for field in AUTHOR_FIELDS
+    )
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_recipes(instance, **kwargs):
+    """
+    Ответы с рецептами содержат профиль автора. Данные рецептов
+    не изменились, поэтому индексы обновлять нечего.
+    """
+    if getattr(instance, '_author_changed', False):
+        bump_version_on_commit(RECIPES_VERSION_KEY, ())
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+@receiver((post_save, post_delete), sender=Follow)
+def invalidate_user_relations(instance, **kwargs):
+    """
+    Избранное, список покупок или подписки пользователя изменились,
+    в том числе в админке и при удалении рецепта или автора.
+    """
+    invalidate_relations(instance.user_id)
+
+
+@receiver(post_delete, sender=Recipe)
+def decrease_recipes_count(instance, **kwargs):
+    """Рецепт удалён через API, в админке или вместе с автором."""
+    change_counter(User, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(pre_delete, sender=User)
+def decrease_related_counters(instance, **kwargs):
+    """
+    Избранное, список покупок и подписки пользователя удаляются
+    каскадом, поэтому счётчики рецептов и авторов уменьшаются заранее.
+    """
+    for model, counter in RECIPE_COUNTERS.items():
+        change_counters(Recipe, model.objects.filter(
+            user=instance
+        ).values('recipe_id'), counter, -1)
+    change_counters(User, Follow.objects.filter(
+        user=instance
+    ).values('author_id'), 'followers_count', -1)
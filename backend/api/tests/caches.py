@@ -0,0 +1,18 @@
+import tempfile
+
+from django.test import override_settings
+
+
+def enable_shared_cache(test_case):
+    """
+    Общий для процессов файловый кэш на время теста: с кэшем в памяти
+    процесса связи пользователя и токены в кэше не хранятся.
+    """
+    location = tempfile.TemporaryDirectory()
+    test_case.addCleanup(location.cleanup)
+    shared_cache = override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': location.name,
+    }})
+    shared_cache.enable()
+    test_case.addCleanup(shared_cache.disable)
@@ -0,0 +1,56 @@
+import tempfile
+
+from django.test import TransactionTestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.authentication import CachedTokenAuthentication, token_cache
+from users.models import User
+
+
+class CachedTokenAuthenticationTest(TransactionTestCase):
+    """Сброс токенов при выходе доходит до кэша после фиксации."""
+    def setUp(self):
+        self.user = User.objects.create(
+            username='reader', email='reader@example.com',
+            first_name='Читатель', last_name='Читатель',
+        )
+        token_cache.clear()
+        self.addCleanup(token_cache.clear)
+        self.token = Token.objects.create(user=self.user)
+
+    def test_local_cache_checks_every_token(self):
+        authentication = CachedTokenAuthentication()
+        authentication.authenticate_credentials(self.token.key)
+        with self.assertNumQueries(1):
+            authentication.authenticate_credentials(self.token.key)
+
+    def test_shared_cache(self):
+        with tempfile.TemporaryDirectory() as location, override_settings(
+            CACHES={'default': {
+                'BACKEND':
+                    'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': location,
+            }},
+        ):
+            authentication = CachedTokenAuthentication()
+            first, _ = authentication.authenticate_credentials(
+                self.token.key,
+            )
+            with self.assertNumQueries(0):
+                second, token = authentication.authenticate_credentials(
+                    self.token.key,
+                )
+            self.assertEqual(second, self.user)
+            self.assertIsNot(second, first)
+            self.assertIs(token.user, second)
+            second.first_name = 'Изменено'
+            self.assertEqual(first.first_name, 'Читатель')
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+            self.assertEqual(
+                client.post('/api/auth/token/logout/').status_code, 204,
+            )
+            self.assertEqual(
+                client.get('/api/users/me/').status_code, 401,
+            )
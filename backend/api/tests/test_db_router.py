@@ -0,0 +1,113 @@
+import tempfile
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.db_router import ReplicaMiddleware
+from recipes.models import Recipe
+from users.models import User
+
+REPLICA = 'replica_0'
+
+
+@skipUnless(
+    REPLICA in settings.DATABASES,
+    'Реплика не настроена: запустите модуль с DB_REPLICA_HOSTS=localhost',
+)
+class ReplicaRoutingTest(TransactionTestCase):
+    """
+    Чтения идут на реплику, записи и чтения после записи - в основную.
+    Реплика - зеркало тестовой базы, поэтому данные фиксируются
+    без обёртывающей транзакции.
+    """
+    databases = {'default', REPLICA}
+
+    def setUp(self):
+        resize = mock.patch('recipes.signals.schedule_resize')
+        resize.start()
+        self.addCleanup(resize.stop)
+        self.reader = User.objects.create(
+            username='reader', email='reader@example.com',
+            first_name='Читатель', last_name='Читатель',
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.reader,
+            name='Рецепт',
+            text='Описание',
+            cooking_time=10,
+            image='recipe_images/test.png',
+        )
+        self.token = Token.objects.create(user=self.reader)
+        location = tempfile.TemporaryDirectory()
+        self.addCleanup(location.cleanup)
+        shared_cache = override_settings(
+            DATABASE_REPLICAS=[REPLICA],
+            CACHES={'default': {
+                'BACKEND':
+                    'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': location.name,
+            }},
+        )
+        shared_cache.enable()
+        self.addCleanup(shared_cache.disable)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def request(self, method, path):
+        with CaptureQueriesContext(
+            connections['default'],
+        ) as primary, CaptureQueriesContext(connections[REPLICA]) as replica:
+            response = getattr(self.client, method)(path)
+            if response.streaming:
+                b''.join(response.streaming_content)
+                response.close()
+        self.assertLess(response.status_code, 400)
+        return primary, replica
+
+    def count_recipe_queries(self, context):
+        return sum(
+            'FROM "recipes_recipe"' in query['sql']
+            for query in context.captured_queries
+        )
+
+    def test_routing(self):
+        primary, replica = self.request('get', '/api/recipes/')
+        self.assertEqual(self.count_recipe_queries(primary), 0)
+        self.assertGreater(self.count_recipe_queries(replica), 0)
+
+        primary, replica = self.request(
+            'post', f'/api/recipes/{self.recipe.pk}/favorite/',
+        )
+        self.assertFalse(replica.captured_queries)
+        self.assertTrue(any(
+            query['sql'].startswith('INSERT')
+            for query in primary.captured_queries
+        ))
+
+        primary, replica = self.request('get', '/api/recipes/')
+        self.assertFalse(replica.captured_queries)
+        self.assertGreater(self.count_recipe_queries(primary), 0)
+
+    def test_streaming_download_reads_primary(self):
+        self.request('post', f'/api/recipes/{self.recipe.pk}/shopping_cart/')
+        # Сбрасывает отметку клиента после записи.
+        cache.clear()
+        primary, replica = self.request(
+            'get', '/api/recipes/download_shopping_cart/',
+        )
+        self.assertFalse(replica.captured_queries)
+
+
+class ReplicaCacheTest(TestCase):
+    """Реплики не включаются без общего кэша."""
+    @override_settings(DATABASE_REPLICAS=[REPLICA])
+    def test_local_cache(self):
+        with self.assertRaises(ImproperlyConfigured):
+            ReplicaMiddleware(lambda request: None)
@@ -0,0 +1,114 @@
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import mock
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase
+
+from core.metrics import (
+    COUNT,
+    DEAD_FILE,
+    QUERIES,
+    SIZE,
+    UNRESOLVED_ROUTE,
+    MetricsMiddleware,
+    WorkerMetrics,
+    collect,
+    write_file,
+)
+from users.models import User
+
+
+def get_dead_pid():
+    process = subprocess.Popen((sys.executable, '-c', ''))
+    process.wait()
+    return process.pid
+
+
+class MetricsMiddlewareTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.metrics = WorkerMetrics(directory.name, 3600)
+        patcher = mock.patch('core.metrics.worker_metrics', self.metrics)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_series(self):
+        self.metrics.aggregate()
+        return self.metrics.series[UNRESOLVED_ROUTE, 'GET']
+
+    def test_regular_response(self):
+        def view(request):
+            User.objects.count()
+            return HttpResponse(b'12345')
+
+        MetricsMiddleware(view)(RequestFactory().get('/'))
+        series = self.get_series()
+        self.assertEqual(series[COUNT], 1)
+        self.assertEqual(series[QUERIES], 1)
+        self.assertEqual(series[SIZE], 5)
+
+    def test_streaming_response_is_recorded_on_close(self):
+        def rows():
+            yield b'users: '
+            yield str(User.objects.count()).encode()
+
+        response = MetricsMiddleware(
+            lambda request: StreamingHttpResponse(rows())
+        )(RequestFactory().get('/'))
+        self.metrics.aggregate()
+        self.assertEqual(self.metrics.series, {})
+        content = b''.join(response.streaming_content)
+        response.close()
+        series = self.get_series()
+        self.assertEqual(series[COUNT], 1)
+        self.assertEqual(series[QUERIES], 1)
+        self.assertEqual(series[SIZE], len(content))
+
+    def test_unread_streaming_response_is_recorded(self):
+        response = MetricsMiddleware(
+            lambda request: StreamingHttpResponse(iter((b'data', )))
+        )(RequestFactory().get('/'))
+        response.close()
+        series = self.get_series()
+        self.assertEqual(series[COUNT], 1)
+        self.assertEqual(series[SIZE], 0)
+
+
+class CollectTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, count):
+        write_file(
+            os.path.join(self.directory, name),
+            {('recipes', 'GET'): [count]},
+            {('recipes', 'GET', 200): count},
+        )
+
+    def test_dead_workers_are_folded(self):
+        dead = f'metrics_{get_dead_pid()}.json'
+        self.write(dead, 2)
+        self.write(f'metrics_{os.getpid()}.json', 3)
+        expected = (
+            {('recipes', 'GET'): [5]},
+            {('recipes', 'GET', 200): 5},
+        )
+        self.assertEqual(collect(self.directory), expected)
+        self.assertFalse(
+            os.path.exists(os.path.join(self.directory, dead))
+        )
+        self.assertTrue(
+            os.path.exists(os.path.join(self.directory, DEAD_FILE))
+        )
+        self.assertEqual(collect(self.directory), expected)
+
+    def test_missing_directory(self):
+        self.assertEqual(
+            collect(os.path.join(self.directory, 'missing')), ({}, {}),
+        )
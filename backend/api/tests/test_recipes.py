@@ -0,0 +1,286 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.relations import get_version_key
+from api.tests.caches import enable_shared_cache
+from core.cache import bump_version, get_version
+from recipes.indexes import RECIPES_VERSION_KEY
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientAmount,
+    Recipe,
+    ShoppingCart,
+    Tag,
+    TrendingRefresh,
+)
+from users.models import Follow, User
+
+RECIPES = 8
+
+
+class RecipeListQueriesTest(TestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create(
+            username='reader', email='reader@example.com',
+            first_name='Читатель', last_name='Читатель',
+        )
+        authors = [
+            User.objects.create(
+                username=f'author{number}',
+                email=f'author{number}@example.com',
+                first_name='Автор', last_name='Автор',
+            )
+            for number in range(2)
+        ]
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {number}', color=f'#00000{number}',
+                slug=f'tag{number}',
+            )
+            for number in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {number}', measurement_unit='г',
+            )
+            for number in range(4)
+        ]
+        for number in range(RECIPES):
+            recipe = Recipe.objects.create(
+                author=authors[number % 2],
+                name=f'Рецепт {number}',
+                text='Описание',
+                cooking_time=10,
+                image='recipe_images/test.png',
+            )
+            recipe.tags.set(tags[:number % 3 + 1])
+            IngredientAmount.objects.bulk_create(
+                IngredientAmount(
+                    recipe=recipe, ingredient=ingredient, amount=100,
+                )
+                for ingredient in ingredients[:number % 4 + 1]
+            )
+            if number % 2:
+                Favorite.objects.create(user=cls.reader, recipe=recipe)
+            if number % 3:
+                ShoppingCart.objects.create(user=cls.reader, recipe=recipe)
+        Follow.objects.create(user=cls.reader, author=authors[0])
+        cls.token = Token.objects.create(user=cls.reader)
+
+    def setUp(self):
+        enable_shared_cache(self)
+        cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def get_recipes(self, limit):
+        response = self.client.get('/api/recipes/', {'limit': limit})
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_list_queries_do_not_depend_on_limit(self):
+        self.get_recipes(1)
+        for limit in (2, RECIPES):
+            with self.subTest(limit=limit), self.assertNumQueries(4):
+                results = self.get_recipes(limit)
+            self.assertEqual(len(results), limit)
+            self.assertTrue(any(
+                recipe['is_favorited'] for recipe in results
+            ))
+            self.assertTrue(any(
+                recipe['is_in_shopping_cart'] for recipe in results
+            ))
+            self.assertTrue(any(
+                recipe['author']['is_subscribed'] for recipe in results
+            ))
+
+    def test_relations_miss_queries_do_not_depend_on_limit(self):
+        """Избранное, покупки и подписки читаются тремя запросами."""
+        self.get_recipes(1)
+        for limit in (2, RECIPES):
+            bump_version(get_version_key(self.reader.pk))
+            with self.subTest(limit=limit), self.assertNumQueries(7):
+                self.get_recipes(limit)
+
+    def test_local_cache_reads_relations_every_request(self):
+        """Без общего кэша связи читаются из БД в каждом запросе."""
+        self.get_recipes(1)
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }}):
+            for limit in (2, RECIPES):
+                with self.subTest(limit=limit), self.assertNumQueries(8):
+                    self.get_recipes(limit)
+
+    def test_stale_tag_registry_queries_do_not_depend_on_limit(self):
+        """Теги, которых нет в реестре, читаются одним запросом."""
+        self.get_recipes(1)
+        for limit in (2, RECIPES):
+            with self.subTest(limit=limit), mock.patch(
+                'api.serializers.tag_registry.get', return_value=None,
+            ), self.assertNumQueries(5):
+                results = self.get_recipes(limit)
+            self.assertTrue(all(
+                tag['slug'] for recipe in results for tag in recipe['tags']
+            ))
+
+
+class TrendingOrderingTest(TestCase):
+    """Рецепты без рейтинга не пропадают из `?ordering=trending`."""
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username='author', email='author@example.com',
+            first_name='Автор', last_name='Автор',
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.author,
+                name=f'Рецепт {number}',
+                text='Описание',
+                cooking_time=10,
+                image='recipe_images/test.png',
+            )
+            for number in range(3)
+        ]
+        Recipe.objects.filter(pk=cls.recipes[0].pk).update(
+            trending_score=0.5,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_recipes_without_score_follow_scored(self):
+        response = self.client.get('/api/recipes/', {'ordering': 'trending'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [recipe.pk for recipe in (
+                self.recipes[0], self.recipes[2], self.recipes[1],
+            )],
+        )
+
+    def test_refresh(self):
+        Favorite.objects.create(user=self.author, recipe=self.recipes[1])
+        self.assertEqual(TrendingRefresh.objects.refresh(full=True), 1)
+        self.assertEqual(
+            list(Recipe.objects.filter(
+                trending_score__gt=0,
+            ).values_list('pk', flat=True)),
+            [self.recipes[1].pk],
+        )
+        Favorite.objects.all().delete()
+        self.assertEqual(TrendingRefresh.objects.refresh(full=True), 0)
+
+
+class SearchPaginationTest(TestCase):
+    """Без Postgres загружаются только рецепты текущей страницы."""
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(
+            username='author', email='author@example.com',
+            first_name='Автор', last_name='Автор',
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                author=author,
+                name=f'Суп {number}',
+                text='Суп' if number % 2 else 'Описание',
+                cooking_time=10,
+                image='recipe_images/test.png',
+            )
+            for number in range(5)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, **params):
+        response = self.client.get(
+            '/api/recipes/', {'search': 'суп', 'limit': 2, **params},
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_pages_follow_relevance(self):
+        expected = [
+            recipe.pk for recipe in
+            sorted(self.recipes, key=lambda recipe: (
+                recipe.text != 'Суп', -recipe.pk,
+            ))
+        ]
+        self.search()
+        pages = []
+        for page in (1, 2, 3):
+            cache.clear()
+            with self.assertNumQueries(4):
+                data = self.search(page=page)
+            self.assertEqual(data['count'], len(self.recipes))
+            pages += [recipe['id'] for recipe in data['results']]
+        self.assertEqual(pages, expected)
+
+
+class AnonymousCacheTest(TransactionTestCase):
+    """Кэш ответов анонимным пользователям не отстаёт от данных."""
+    def setUp(self):
+        resize = mock.patch('recipes.signals.schedule_resize')
+        resize.start()
+        self.addCleanup(resize.stop)
+        cache.clear()
+        self.author = User.objects.create(
+            username='author', email='author@example.com',
+            first_name='Автор', last_name='Автор',
+        )
+        self.recipes = [
+            Recipe.objects.create(
+                author=self.author,
+                name=f'Рецепт {number}',
+                text='Описание',
+                cooking_time=10,
+                image='recipe_images/test.png',
+            )
+            for number in range(2)
+        ]
+
+    def get_recipes(self, **params):
+        response = self.client.get('/api/recipes/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_popular_follows_favorites_count(self):
+        for recipe in self.recipes:
+            Recipe.objects.filter(pk=recipe.pk).update(
+                favorites_count=recipe.pk,
+            )
+            results = self.get_recipes(ordering='popular')
+            self.assertEqual(results[0]['id'], recipe.pk)
+
+    def test_author_profile_changes(self):
+        self.get_recipes()
+        self.author.first_name = 'Повар'
+        self.author.save()
+        self.assertEqual(
+            {recipe['author']['first_name'] for recipe in self.get_recipes()},
+            {'Повар'},
+        )
+
+    def test_signup_and_other_fields_keep_cache(self):
+        version = get_version(RECIPES_VERSION_KEY)
+        response = self.client.post('/api/users/', {
+            'email': 'cook@example.com', 'username': 'cook',
+            'first_name': 'Повар', 'last_name': 'Повар',
+            'password': 'Sup3r-secret-pass',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.author.is_staff = True
+        self.author.save()
+        self.author.set_password('An0ther-secret-pass')
+        self.author.save(update_fields=['password'])
+        self.assertEqual(get_version(RECIPES_VERSION_KEY), version)
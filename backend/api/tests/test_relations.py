@@ -0,0 +1,101 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.relations import load_relations
+from api.tests.caches import enable_shared_cache
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Follow, User
+
+
+def create_user(username):
+    return User.objects.create(
+        username=username, email=f'{username}@example.com',
+        first_name='Имя', last_name='Фамилия',
+    )
+
+
+def create_recipe(author, number):
+    return Recipe.objects.create(
+        author=author,
+        name=f'Рецепт {number}',
+        text='Описание',
+        cooking_time=10,
+        image='recipe_images/test.png',
+    )
+
+
+class RelationsInvalidationTest(TransactionTestCase):
+    """Связи сбрасываются и при изменениях не через API."""
+    def setUp(self):
+        resize = mock.patch('recipes.signals.schedule_resize')
+        resize.start()
+        self.addCleanup(resize.stop)
+        enable_shared_cache(self)
+        cache.clear()
+        self.reader = create_user('reader')
+        self.author = create_user('author')
+        self.recipe = create_recipe(self.author, 0)
+
+    def test_orm_changes(self):
+        self.assertFalse(load_relations(self.reader.pk).favorites)
+        Favorite.objects.create(user=self.reader, recipe=self.recipe)
+        ShoppingCart.objects.create(user=self.reader, recipe=self.recipe)
+        Follow.objects.create(user=self.reader, author=self.author)
+        relations = load_relations(self.reader.pk)
+        self.assertEqual(relations.favorites, {self.recipe.pk})
+        self.assertEqual(relations.cart, {self.recipe.pk})
+        self.assertEqual(relations.following, {self.author.pk})
+        self.recipe.delete()
+        Follow.objects.filter(user=self.reader).delete()
+        relations = load_relations(self.reader.pk)
+        self.assertFalse(relations.favorites)
+        self.assertFalse(relations.cart)
+        self.assertFalse(relations.following)
+
+
+class RelatedFilterTest(TestCase):
+    """Фильтры по избранному и списку покупок для больших списков."""
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = create_user('reader')
+        author = create_user('author')
+        cls.recipes = [create_recipe(author, number) for number in range(5)]
+        Favorite.objects.bulk_create(
+            Favorite(user=cls.reader, recipe=recipe)
+            for recipe in cls.recipes[:3]
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=cls.reader, recipe=recipe)
+            for recipe in cls.recipes[2:]
+        )
+        cls.token = Token.objects.create(user=cls.reader)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def get_ids(self, params):
+        response = self.client.get('/api/recipes/', params)
+        self.assertEqual(response.status_code, 200)
+        return {recipe['id'] for recipe in response.data['results']}
+
+    def test_filters(self):
+        for max_ids in (100, 1):
+            with self.subTest(max_ids=max_ids), mock.patch(
+                'api.filters.Limits', mock.Mock(MAX_FILTER_IDS=max_ids),
+            ):
+                self.assertEqual(
+                    self.get_ids({'is_favorited': 1}),
+                    {recipe.pk for recipe in self.recipes[:3]},
+                )
+                self.assertEqual(
+                    self.get_ids({
+                        'is_favorited': 1, 'is_in_shopping_cart': 1,
+                    }),
+                    {self.recipes[2].pk},
+                )
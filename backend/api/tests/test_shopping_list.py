@@ -0,0 +1,27 @@
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+from reportlab.pdfbase import pdfmetrics
+
+from api.utlis import PDF_FONT_NAME, render_pdf
+from users.models import User
+
+INGREDIENTS = [{'name': 'картофель', 'amount': 500, 'measurement': 'г'}]
+
+
+class ShoppingListPdfTest(SimpleTestCase):
+    """Список покупок в PDF строится только шрифтом с кириллицей."""
+    user = User(username='reader', first_name='Читатель')
+
+    def test_font_with_cyrillic(self):
+        content = b''.join(render_pdf(self.user, iter(INGREDIENTS)))
+        self.assertTrue(content.startswith(b'%PDF'))
+        self.assertIn(PDF_FONT_NAME, pdfmetrics.getRegisteredFontNames())
+
+    @override_settings(SHOPPING_LIST_FONT='/nonexistent/font.ttf')
+    def test_missing_font(self):
+        with mock.patch.object(
+            pdfmetrics, 'getRegisteredFontNames', return_value=[],
+        ), self.assertRaises(ImproperlyConfigured):
+            render_pdf(self.user, iter(INGREDIENTS))
@@ -1,61 +1,262 @@
+import csv
+import os
+from collections import defaultdict
 from datetime import datetime as dt
-from django.db.models import F, Sum
-from django.http.response import HttpResponse
+from io import BytesIO
+from itertools import chain
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http.response import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from rest_framework.status import (
+    HTTP_200_OK,
     HTTP_201_CREATED,
     HTTP_204_NO_CONTENT,
     HTTP_400_BAD_REQUEST
 )
 from rest_framework.response import Response
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
 
+from api.relations import invalidate_relations
 from api.serializers import FavoriteSerializer
 from backend.settings import DATE_TIME_FORMAT
-from recipes.models import Recipe, Ingredient
+from core.counters import change_counter, change_counters
+from recipes.models import Favorite, Recipe, ShoppingCart, ShoppingCartTotal
+
+CART_FOOTER = 'Посчитано в Foodgram'
+STREAM_CHUNK_SIZE = 64 * 1024
+PDF_FONT_NAME = 'ShoppingListFont'
+PDF_FONT_SIZE = 12
+PDF_LINE_HEIGHT = 18
+PDF_MARGIN = 50
+BATCH_ATTEMPTS = 2
+RECIPE_COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'carts_count',
+}
 
 
 def post_method(model, user, pk):
-    if model.objects.filter(user=user, recipe__id=pk).exists():
+    """
+    Добавляет рецепт одной вставкой. Повтор ловится ограничением
+    уникальности, а не предварительной проверкой, поэтому
+    одновременные запросы не приводят к ошибке 500.
+    """
+    recipe = get_object_or_404(Recipe, pk=pk)
+    try:
+        with transaction.atomic():
+            instance = model.objects.create(user=user, recipe=recipe)
+            change_counter(Recipe, recipe.pk, RECIPE_COUNTERS[model])
+            if model is ShoppingCart:
+                ShoppingCartTotal.objects.add_recipe(user, recipe)
+    except IntegrityError:
         return Response(
             'Уже существует', status=HTTP_400_BAD_REQUEST
         )
-    recipe = get_object_or_404(Recipe, pk=pk)
-    instance = model.objects.create(user=user, recipe=recipe)
     serializer = FavoriteSerializer(instance)
     return Response(data=serializer.data, status=HTTP_201_CREATED)
 
 
 def delete_method(model, user, pk):
-    if model.objects.filter(user=user, recipe__id=pk).exists():
-        model.objects.filter(
-            user=user, recipe__id=pk
-        ).delete()
-        return Response(status=HTTP_204_NO_CONTENT)
-    return Response(status=HTTP_400_BAD_REQUEST)
+    """Удаляет рецепт одним DELETE, проверяя число удалённых строк."""
+    with transaction.atomic():
+        deleted, _ = model.objects.filter(user=user, recipe_id=pk).delete()
+        if not deleted:
+            return Response(status=HTTP_400_BAD_REQUEST)
+        change_counter(Recipe, pk, RECIPE_COUNTERS[model], -1)
+        if model is ShoppingCart:
+            ShoppingCartTotal.objects.remove_recipe(user, pk)
+    return Response(status=HTTP_204_NO_CONTENT)
+
+
+def batch_results(ids, statuses):
+    return Response(
+        {'results': [{'id': pk, 'status': statuses[pk]} for pk in ids]},
+        status=HTTP_200_OK,
+    )
+
+
+def post_batch_method(model, user, ids):
+    """
+    Добавляет несколько рецептов одной вставкой в одной транзакции.
+    Если параллельный запрос успел вставить те же строки, ограничение
+    уникальности откатывает транзакцию, и она повторяется.
+    """
+    ids = list(dict.fromkeys(ids))
+    for attempt in range(BATCH_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                found = set(Recipe.objects.filter(
+                    pk__in=ids
+                ).values_list('pk', flat=True))
+                existing = set(model.objects.filter(
+                    user=user, recipe_id__in=found
+                ).values_list('recipe_id', flat=True))
+                created = [pk for pk in ids if pk in found - existing]
+                model.objects.bulk_create(
+                    model(user=user, recipe_id=pk) for pk in created
+                )
+                change_counters(Recipe, created, RECIPE_COUNTERS[model])
+                # `bulk_create` не отправляет сигналы `post_save`.
+                invalidate_relations(user.id)
+                if model is ShoppingCart and created:
+                    ShoppingCartTotal.objects.add_recipes(user, created)
+            break
+        except IntegrityError:
+            if attempt == BATCH_ATTEMPTS - 1:
+                raise
+    statuses = {pk: 'created' for pk in created}
+    statuses.update({pk: 'exists' for pk in existing})
+    return batch_results(ids, defaultdict(lambda: 'not_found', statuses))
 
 
-def download_cart(user):
-    filename = f'{user.username}_shopping_list.txt'
-    shopping_list = [
+def delete_batch_method(model, user, ids):
+    """Удаляет несколько рецептов одним DELETE в одной транзакции."""
+    ids = list(dict.fromkeys(ids))
+    with transaction.atomic():
+        rows = model.objects.filter(user=user, recipe_id__in=ids)
+        deleted = list(rows.select_for_update().values_list(
+            'recipe_id', flat=True
+        ))
+        rows.filter(recipe_id__in=deleted).delete()
+        change_counters(Recipe, deleted, RECIPE_COUNTERS[model], -1)
+        if model is ShoppingCart and deleted:
+            ShoppingCartTotal.objects.remove_recipes(user, deleted)
+    statuses = defaultdict(
+        lambda: 'not_found', {pk: 'deleted' for pk in deleted}
+    )
+    return batch_results(ids, statuses)
+
+
+def clear_cart(user):
+    """Очищает список покупок одним DELETE."""
+    with transaction.atomic():
+        carts = ShoppingCart.objects.filter(user=user)
+        recipe_ids = list(carts.select_for_update().values_list(
+            'recipe_id', flat=True
+        ))
+        carts.delete()
+        change_counters(Recipe, recipe_ids, 'carts_count', -1)
+        ShoppingCartTotal.objects.filter(user=user).delete()
+    return Response(status=HTTP_204_NO_CONTENT)
+
+
+def get_cart_ingredients(user):
+    """
+    Суммарное количество ингредиентов из списка покупок
+    по заранее посчитанным итогам пользователя.
+    Строки читаются курсором на стороне сервера, а не списком в памяти.
+    """
+    return ShoppingCartTotal.objects.filter(user=user).values(
+        'amount',
+        name=F('ingredient__name'),
+        measurement=F('ingredient__measurement_unit'),
+    ).order_by('ingredient__name').iterator()
+
+
+def get_cart_header(user):
+    return (
         f'Список покупок для:\n\n{user.first_name}\n'
         f'{dt.now().strftime(DATE_TIME_FORMAT)}\n'
-    ]
+    )
+
 
-    ingredients = Ingredient.objects.filter(
-        recipe__recipe__in_carts__user=user
-    ).values(
-        'name',
-        measurement=F('measurement_unit')
-    ).annotate(amount=Sum('recipe__amount'))
+class Echo:
+    """Псевдобуфер: csv.writer сразу возвращает записанную строку."""
+    def write(self, value):
+        return value
 
+
+def render_txt(user, ingredients):
+    yield get_cart_header(user)
     for ing in ingredients:
-        shopping_list.append(
-            f'{ing["name"]}: {ing["amount"]} {ing["measurement"]}'
+        yield f'\n{ing["name"]}: {ing["amount"]} {ing["measurement"]}'
+    yield f'\n\n{CART_FOOTER}'
+
+
+def render_csv(user, ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Количество', 'Единица измерения'))
+    for ing in ingredients:
+        yield writer.writerow((ing['name'], ing['amount'], ing['measurement']))
+
+
+def get_pdf_font():
+    """
+    Шрифт с кириллицей из `SHOPPING_LIST_FONT`. Встроенные шрифты
+    PDF кириллицу не выводят, поэтому без него список не строится.
+    """
+    if PDF_FONT_NAME in pdfmetrics.getRegisteredFontNames():
+        return PDF_FONT_NAME
+    if not os.path.exists(settings.SHOPPING_LIST_FONT):
+        raise ImproperlyConfigured(
+            f'Не найден шрифт списка покупок {settings.SHOPPING_LIST_FONT}: '
+            'задайте SHOPPING_LIST_FONT или установите fonts-dejavu-core.'
         )
-    shopping_list.append('\nПосчитано в Foodgram')
-    shopping_list = '\n'.join(shopping_list)
-    response = HttpResponse(
-        shopping_list, content_type='text.txt; charset=utf-8'
+    pdfmetrics.registerFont(
+        TTFont(PDF_FONT_NAME, settings.SHOPPING_LIST_FONT)
+    )
+    return PDF_FONT_NAME
+
+
+def render_pdf(user, ingredients):
+    """
+    Шрифт проверяется до начала ответа, чтобы ошибка не оборвала
+    уже начатую загрузку файла.
+    """
+    return stream_pdf(user, ingredients, get_pdf_font())
+
+
+def stream_pdf(user, ingredients, font):
+    """
+    PDF требует таблицу ссылок в конце документа, поэтому файл
+    собирается целиком и затем отдаётся частями.
+    """
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    lines = chain(
+        get_cart_header(user).splitlines(),
+        (
+            f'{ing["name"]}: {ing["amount"]} {ing["measurement"]}'
+            for ing in ingredients
+        ),
+        ('', CART_FOOTER),
+    )
+    y = height - PDF_MARGIN
+    pdf.setFont(font, PDF_FONT_SIZE)
+    for line in lines:
+        if y < PDF_MARGIN:
+            pdf.showPage()
+            pdf.setFont(font, PDF_FONT_SIZE)
+            y = height - PDF_MARGIN
+        pdf.drawString(PDF_MARGIN, y, line)
+        y -= PDF_LINE_HEIGHT
+    pdf.save()
+    buffer.seek(0)
+    yield from iter(lambda: buffer.read(STREAM_CHUNK_SIZE), b'')
+
+
+RENDERERS = {
+    'txt': (render_txt, 'text/plain; charset=utf-8'),
+    'csv': (render_csv, 'text/csv; charset=utf-8'),
+    'pdf': (render_pdf, 'application/pdf'),
+}
+SHOPPING_LIST_FORMATS = tuple(RENDERERS)
+
+
+def download_cart(user, file_format='txt'):
+    render, content_type = RENDERERS[file_format]
+    filename = f'{user.username}_shopping_list.{file_format}'
+    response = StreamingHttpResponse(
+        render(user, get_cart_ingredients(user)), content_type=content_type
     )
     response['Content-Disposition'] = f'attachment; filename={filename}'
+    response['X-Accel-Buffering'] = 'no'
     return response
@@ -1,68 +1,160 @@
+from django.db.models import Prefetch
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.permissions import AllowAny, SAFE_METHODS, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.status import (
     HTTP_400_BAD_REQUEST,
 )
 
-from api.filters import IngredientSearchFilter, RecipeFilter
-from api.pagination import CustomPagination
+from api.filters import POPULAR, RecipeFilter
+from api.mixins import AnonymousCacheMixin, ETagMixin
+from api.pagination import (
+    CustomPagination,
+    FeedPagination,
+    SwitchablePaginationMixin,
+)
 from api.permissions import IsAuthorAdminOrReadOnly
+from api.renderers import CsvRenderer, PdfRenderer, TxtRenderer
 from api.serializers import (
     TagsSerializer,
     IngredientSerializer,
     RecipeChangeSerializer,
+    IngredientMatchSerializer,
     RecipeGetSerializer,
+    RecipeIdsSerializer,
+    RecipeMatchSerializer,
+)
+from api.utlis import (
+    SHOPPING_LIST_FORMATS,
+    clear_cart,
+    delete_batch_method,
+    delete_method,
+    download_cart,
+    post_batch_method,
+    post_method,
+)
+from recipes.indexes import (
+    RECIPES_VERSION_KEY,
+    ingredient_index,
+    recipe_ingredient_index,
+    tag_registry,
 )
-from api.utlis import post_method, delete_method, download_cart
 from recipes.models import (
     Favorite,
+    FeedItem,
     Ingredient,
+    IngredientAmount,
     Recipe,
     ShoppingCart,
     Tag,
 )
+from recipes.search import get_ranking, paginate_ranked
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ETagMixin, viewsets.ReadOnlyModelViewSet):
     """
     Работает с тэгами.
     Изменение и создание тэгов разрешено только админам.
+    Теги отдаются из реестра в памяти с поддержкой ETag.
     """
     queryset = Tag.objects.all()
     serializer_class = TagsSerializer
+    read_from_replica = True
     pagination_class = None
     permission_classes = (AllowAny, )
 
+    def list(self, request, *args, **kwargs):
+        return self.get_etag_response(
+            request, tag_registry.all, tag_registry.etag(),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_field]
+        tag = tag_registry.get(int(pk)) if pk.isdigit() else None
+        if tag is None:
+            raise NotFound
+        return Response(tag)
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+
+class IngredientViewSet(ETagMixin, viewsets.ReadOnlyModelViewSet):
     """
     Работает с ингридиентами.
     Изменение и создание ингредиентов разрешено только админам.
+    Список и поиск по `?name=` отдаются из индекса в памяти
+    с поддержкой ETag.
     """
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
+    read_from_replica = True
     pagination_class = None
     permission_classes = (AllowAny, )
-    filter_backends = [IngredientSearchFilter]
-    search_fields = ('^name',)
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            return self.get_etag_response(
+                request,
+                lambda: ingredient_index.search(name),
+                ingredient_index.etag(name),
+            )
+        return self.get_etag_response(
+            request, ingredient_index.all, ingredient_index.etag(),
+        )
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+    AnonymousCacheMixin, SwitchablePaginationMixin, viewsets.ModelViewSet,
+):
     """
     Работает с рецептами.
     Для добавление рецепта необходимо быть авторизованным.
     Удаление и редактирование рецепта
     разрешено только его автором или администратором.
+    Параметр `?pagination=cursor` включает курсорную пагинацию.
+    Ответы анонимным пользователям кэшируются до изменения рецептов
+    или профилей их авторов. `?ordering=popular` не кэшируется:
+    счётчики избранного меняются при каждом добавлении.
     """
     queryset = Recipe.objects.all()
+    cache_version_key = RECIPES_VERSION_KEY
+    uncached_params = (('ordering', POPULAR), )
+    read_from_replica = True
     permission_classes = (IsAuthorAdminOrReadOnly, )
     pagination_class = CustomPagination
     filter_backends = (DjangoFilterBackend,)
     filter_class = RecipeFilter
 
+    def get_queryset(self):
+        """
+        Загружает страницу рецептов фиксированным числом запросов:
+        автор через JOIN, теги и ингредиенты через prefetch.
+        Для тегов загружаются только id, остальное берётся из реестра.
+        Флаги текущего пользователя берутся из `api.relations`.
+        """
+        return Recipe.objects.select_related('author').prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.only('id')),
+            Prefetch(
+                'ingredient',
+                queryset=IngredientAmount.objects.select_related('ingredient'),
+            ),
+        )
+
+    def paginate_queryset(self, queryset):
+        """
+        Результаты поиска без Postgres идут в порядке индекса в памяти,
+        если клиент не выбрал другую сортировку.
+        """
+        ranking = get_ranking(self.request)
+        if ranking is None or 'ordering' in self.request.query_params:
+            return super().paginate_queryset(queryset)
+        return paginate_ranked(
+            queryset, ranking, super().paginate_queryset,
+        )
+
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeGetSerializer
@@ -98,17 +190,132 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return post_method(ShoppingCart, request.user, pk)
         return delete_method(ShoppingCart, request.user, pk)
 
+    def batch(self, request, model):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        if request.method == 'POST':
+            return post_batch_method(model, request.user, ids)
+        return delete_batch_method(model, request.user, ids)
+
+    @action(
+        detail=False,
+        methods=('post', 'delete'),
+        permission_classes=(IsAuthenticated, ),
+        url_path='favorite/batch',
+    )
+    def favorite_batch(self, request):
+        """
+        Добавляет в избранное или удаляет из него список рецептов
+        `{"ids": [...]}` и возвращает результат для каждого id.
+        """
+        return self.batch(request, Favorite)
+
+    @action(
+        detail=False,
+        methods=('post', 'delete'),
+        permission_classes=(IsAuthenticated, ),
+        url_path='shopping_cart/batch',
+    )
+    def shopping_cart_batch(self, request):
+        """
+        Добавляет в список покупок или удаляет из него список
+        рецептов `{"ids": [...]}` и возвращает результат для каждого id.
+        """
+        return self.batch(request, ShoppingCart)
+
+    @action(
+        detail=False,
+        methods=('delete', ),
+        permission_classes=(IsAuthenticated, ),
+        url_path='shopping_cart/clear',
+    )
+    def shopping_cart_clear(self, request):
+        """Очищает список покупок пользователя."""
+        return clear_cart(request.user)
+
+    @action(
+        detail=False,
+        methods=('post', ),
+        permission_classes=(AllowAny, ),
+        cursor_pagination_class=None,
+    )
+    def match(self, request):
+        """
+        Подбирает рецепты по имеющимся ингредиентам
+        `{"ingredients": [...], "min_coverage": 0.5}`: сначала рецепты,
+        для которых есть наибольшая доля ингредиентов.
+        """
+        serializer = IngredientMatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        page = self.paginate_queryset(recipe_ingredient_index.match(
+            serializer.validated_data['ingredients'],
+            serializer.validated_data['min_coverage'],
+        ))
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _ in page]
+        )
+        matched = []
+        for recipe_id, coverage in page:
+            recipe = recipes.get(recipe_id)
+            if recipe is not None:
+                recipe.coverage = round(coverage, 3)
+                matched.append(recipe)
+        serializer = RecipeMatchSerializer(
+            matched, many=True, context=self.get_serializer_context(),
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=('get', ),
+        permission_classes=(IsAuthenticated, ),
+        pagination_class=FeedPagination,
+        cursor_pagination_class=None,
+    )
+    def feed(self, request):
+        """
+        Лента рецептов авторов, на которых подписан пользователь,
+        от новых к старым. Следующая страница - по `next`.
+        """
+        page = self.paginator.paginate_feed(
+            lambda limit, before: FeedItem.objects.get_page(
+                request.user, limit, before,
+            ),
+            request,
+        )
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _ in page]
+        )
+        serializer = RecipeGetSerializer(
+            [recipes[recipe_id] for recipe_id, _ in page
+             if recipe_id in recipes],
+            many=True,
+            context=self.get_serializer_context(),
+        )
+        return self.get_paginated_response(serializer.data)
+
     @action(
         detail=False,
         methods=['get'],
-        permission_classes=(IsAuthenticated, )
+        permission_classes=(IsAuthenticated, ),
+        renderer_classes=(
+            TxtRenderer, CsvRenderer, PdfRenderer, JSONRenderer,
+        ),
+        read_from_replica=False,
     )
     def download_shopping_cart(self, request):
         """
-        Позволяет скачать файл списка покупок.
+        Позволяет скачать файл списка покупок
+        в формате `?format=txt|csv|pdf` (по умолчанию txt).
         Доступно только авторизованным пользователям.
+        Файл отдаётся потоком и читается из основной базы,
+        поэтому и проверка списка выполняется там же.
         """
         user = request.user
         if not user.carts.exists():
             return Response(status=HTTP_400_BAD_REQUEST)
-        return download_cart(user)
+        file_format = request.accepted_renderer.format
+        if file_format not in SHOPPING_LIST_FORMATS:
+            file_format = 'txt'
+        return download_cart(user, file_format)
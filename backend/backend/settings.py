@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 from dotenv import load_dotenv
 
@@ -26,16 +27,18 @@ INSTALLED_APPS = [
     'djoser',
     'django_filters',
     'users',
-    'recipes',
-    'api',
+    'recipes.apps.RecipesConfig',
+    'api.apps.ApiConfig',
 ]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.db_router.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -70,9 +73,60 @@ DATABASES = {
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
         'PORT': os.getenv('DB_PORT'),
+        # Соединение переиспользуется между запросами, исправность
+        # проверяет `core.db_router.check_connections`.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
     },
 }
 
+# Реплики для чтения: DB_REPLICA_HOSTS=host1:5432,host2. Остальные
+# параметры берутся из основной базы. Для проверки на SQLite
+# достаточно DB_REPLICA_HOSTS=localhost: реплика откроет тот же файл.
+DATABASE_REPLICAS = []
+for number, address in enumerate(
+    filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(','))
+):
+    host, _, port = address.strip().partition(':')
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{number}')
+
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+# Сколько секунд после записи клиент читает только из основной базы.
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 10))
+DB_HEALTH_CHECK_INTERVAL = float(os.getenv('DB_HEALTH_CHECK_INTERVAL', 10))
+
+# По умолчанию кэш в памяти процесса. Для общего кэша между воркерами
+# задайте, например, CACHE_BACKEND=django_redis.cache.RedisCache
+# и CACHE_LOCATION=redis://127.0.0.1:6379/1 (нужен пакет django-redis).
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+    },
+}
+
+# Как часто индексы в памяти процесса сверяются с БД, если кэш
+# не общий и изменения из управляющих команд до воркеров не доходят.
+INDEX_CHECK_INTERVAL = float(os.getenv('INDEX_CHECK_INTERVAL', 60))
+
+# Время жизни закэшированных ответов для анонимных пользователей.
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 300))
+# Время жизни избранного, списка покупок и подписок пользователя в кэше.
+RELATIONS_CACHE_TIMEOUT = int(os.getenv('RELATIONS_CACHE_TIMEOUT', 3600))
+
+# Кэш проверенных токенов в памяти процесса: число записей
+# и время жизни записи в секундах. Работает только с общим кэшем,
+# через который до воркеров доходит сброс токенов при выходе.
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 10000))
+TOKEN_CACHE_TIMEOUT = int(os.getenv('TOKEN_CACHE_TIMEOUT', 300))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -104,6 +158,45 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Изображения рецептов: предельный размер загрузки, число фоновых
+# потоков для уменьшения (0 - обрабатывать сразу) и размеры копий.
+IMAGE_MAX_UPLOAD_SIZE = int(
+    os.getenv('IMAGE_MAX_UPLOAD_SIZE', 5 * 1024 * 1024)
+)
+DATA_UPLOAD_MAX_MEMORY_SIZE = IMAGE_MAX_UPLOAD_SIZE * 4 // 3 + 1024 * 1024
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', 2))
+RECIPE_IMAGE_FORMAT = 'WEBP'
+RECIPE_IMAGE_QUALITY = 80
+RECIPE_IMAGE_SIZES = {
+    'image_thumbnail': (320, 320),
+    'image_card': (720, 720),
+}
+
+# Сортировка `?ordering=trending`: учитываются добавления в избранное
+# за последние дни, вес каждого убывает вдвое за период полураспада.
+TRENDING_WINDOW_DAYS = int(os.getenv('TRENDING_WINDOW_DAYS', 7))
+TRENDING_HALF_LIFE_HOURS = int(os.getenv('TRENDING_HALF_LIFE_HOURS', 48))
+
+# Рецепты авторов, у которых подписчиков больше этого числа,
+# не раскладываются по лентам, а добавляются при чтении ленты.
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 1000))
+# Потоки, раскладывающие рецепты по лентам после публикации.
+FEED_WORKERS = int(os.getenv('FEED_WORKERS', 1))
+
+# Метрики запросов: каталог с файлами процессов gunicorn
+# и период записи в них, секунды.
+METRICS_DIR = os.getenv(
+    'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'foodgram_metrics'),
+)
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+
+# TTF-шрифт с кириллицей для списка покупок в PDF. Без него
+# `?format=pdf` отвечает ошибкой.
+SHOPPING_LIST_FONT = os.getenv(
+    'SHOPPING_LIST_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+)
+
 DJOSER = {
     "LOGIN_FIELD": 'email',
     "SEND_ACTIVATION_EMAIL": False,
@@ -125,7 +218,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_PAGINATION_CLASS':
         'api.pagination.CustomPagination',
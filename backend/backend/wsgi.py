@@ -10,7 +10,14 @@ https://docs.djangoproject.com/en/2.2/howto/deployment/wsgi/
 import os
 
 from django.core.wsgi import get_wsgi_application
+from django.db import DatabaseError
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+try:
+    from recipes.indexes import ingredient_index
+    ingredient_index.warm()
+except DatabaseError:
+    pass
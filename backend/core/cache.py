@@ -0,0 +1,80 @@
+"""Версии данных в общем кэше для инвалидации локальных структур."""
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+# Бэкенды, данные которых не видны другим процессам.
+LOCAL_BACKENDS = (DummyCache, LocMemCache)
+# Сколько хранятся и сколько версий подряд применяются списки
+# изменений. Структуры, отставшие сильнее, перестраиваются целиком.
+CHANGES_TIMEOUT = 3600
+MAX_CHANGES = 1000
+
+
+def is_shared():
+    """
+    Общий ли кэш для всех процессов. Версии, увеличенные в кэше
+    процесса, не доходят до других воркеров и управляющих команд.
+    """
+    return not isinstance(caches[DEFAULT_CACHE_ALIAS], LOCAL_BACKENDS)
+
+
+def get_version(key):
+    """Текущая версия данных, хранящаяся в кэше под ключом `key`."""
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, timeout=None)
+        return cache.get(key, 1)
+    return version
+
+
+def get_changes_key(key, version):
+    return f'{key}:changes:{version}'
+
+
+def bump_version(key, changes=None):
+    """
+    Увеличивает версию данных. Структуры, построенные по предыдущей
+    версии, перестраиваются при следующем обращении. `changes` - id
+    изменённых объектов, по ним структуры можно обновить частично.
+    """
+    cache.add(key, 1, timeout=None)
+    try:
+        version = cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+        return 1
+    if changes is not None:
+        cache.set(
+            get_changes_key(key, version), list(changes), CHANGES_TIMEOUT,
+        )
+    return version
+
+
+def get_changes(key, since, version):
+    """
+    id объектов, изменённых после версии `since` до `version`
+    включительно, или None, если хотя бы одна версия увеличена без
+    списка изменений или он уже удалён из кэша.
+    """
+    if not 0 < version - since <= MAX_CHANGES:
+        return None
+    keys = [
+        get_changes_key(key, number)
+        for number in range(since + 1, version + 1)
+    ]
+    entries = cache.get_many(keys)
+    if len(entries) != len(keys):
+        return None
+    return set().union(*entries.values())
+
+
+def bump_version_on_commit(key, changes=None):
+    """
+    Увеличивает версию после фиксации текущей транзакции, чтобы
+    другие запросы не закэшировали данные, которые ещё не записаны.
+    """
+    if changes is not None:
+        changes = list(changes)
+    transaction.on_commit(lambda: bump_version(key, changes))
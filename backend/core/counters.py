@@ -0,0 +1,100 @@
+"""Денормализованные счётчики связанных объектов."""
+from collections import Counter
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+
+def shifted(counter, delta):
+    """
+    Новое значение счётчика. Уменьшение не опускает разошедшийся
+    счётчик ниже нуля, расхождение исправляет `reconcile_counters`.
+    """
+    if delta < 0:
+        return Greatest(F(counter) + delta, 0)
+    return F(counter) + delta
+
+
+def change_counter(model, pk, counter, delta=1):
+    """
+    Атомарно сдвигает счётчик `counter` объекта на `delta` одним
+    UPDATE ... SET counter = counter + delta.
+    """
+    model.objects.filter(pk=pk).update(**{counter: shifted(counter, delta)})
+
+
+def change_counters(model, pks, counter, delta=1):
+    """Сдвигает счётчик сразу у нескольких объектов одним UPDATE."""
+    model.objects.filter(pk__in=pks).update(
+        **{counter: shifted(counter, delta)}
+    )
+
+
+def count_related(related_model, field):
+    """
+    Подзапрос: количество строк `related_model`, ссылающихся
+    на объект внешнего запроса через поле `field`.
+    """
+    return Coalesce(
+        Subquery(
+            related_model.objects.filter(
+                **{field: OuterRef('pk')}
+            ).order_by().values(field).annotate(
+                total=Count('pk')
+            ).values('total')
+        ),
+        0,
+    )
+
+
+def find_counter_drift(model, counter, related_model, field):
+    """Объекты, у которых счётчик разошёлся с настоящим количеством."""
+    return model.objects.annotate(
+        actual_count=count_related(related_model, field),
+    ).exclude(**{counter: F('actual_count')})
+
+
+def reconcile_counter(model, counter, related_model, field):
+    """Пересчитывает счётчик у всех объектов одним UPDATE."""
+    return model.objects.update(
+        **{counter: count_related(related_model, field)}
+    )
+
+
+class CounterAdminMixin:
+    """
+    Сдвигает счётчик `counter` объекта модели `counter_model`,
+    на который ссылается поле `counter_field`, когда строки
+    добавляются, меняются и удаляются в админке.
+    """
+    counter_model = None
+    counter = None
+    counter_field = None
+
+    def get_counter_pk(self, obj):
+        return getattr(obj, f'{self.counter_field}_id')
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            old_pk = type(obj).objects.values_list(
+                f'{self.counter_field}_id', flat=True,
+            ).get(pk=obj.pk)
+            change_counter(self.counter_model, old_pk, self.counter, -1)
+        super().save_model(request, obj, form, change)
+        change_counter(
+            self.counter_model, self.get_counter_pk(obj), self.counter,
+        )
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        change_counter(
+            self.counter_model, self.get_counter_pk(obj), self.counter, -1,
+        )
+
+    def delete_queryset(self, request, queryset):
+        deleted = Counter(queryset.values_list(
+            f'{self.counter_field}_id', flat=True,
+        ))
+        super().delete_queryset(request, queryset)
+        for pk, count in deleted.items():
+            change_counter(self.counter_model, pk, self.counter, -count)
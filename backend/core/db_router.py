@@ -0,0 +1,172 @@
+"""
+Чтение с реплик базы данных.
+
+`ReplicaMiddleware` направляет безопасные запросы к представлениям
+с `read_from_replica = True` на одну из исправных реплик
+`DATABASE_REPLICAS`, а `ReplicaRouter` отправляет туда чтения этого
+запроса. Записи и миграции всегда идут в основную базу. Действие
+viewset отключает реплику параметром `@action(read_from_replica=False)`.
+Так нужно делать для потоковых ответов: их содержимое читается уже
+после выхода из middleware, то есть из основной базы.
+
+После любого изменяющего запроса клиент на `REPLICA_PIN_SECONDS`
+читает только из основной базы и видит свои изменения, даже если
+реплика отстаёт. Отметка хранится в кэше, поэтому без общего кэша
+реплики не включаются.
+"""
+import random
+from contextlib import contextmanager
+from hashlib import md5
+from threading import local
+from time import monotonic
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import request_started
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.dispatch import receiver
+
+from core.cache import is_shared
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Токены читаются из основной базы: после входа новый токен
+# может ещё не дойти до реплики.
+PRIMARY_ONLY_APPS = ('authtoken', )
+
+_state = local()
+# Алиас -> (исправно ли соединение, время проверки).
+_health = {}
+
+
+def get_replica():
+    """Реплика, из которой читает текущий запрос, или None."""
+    return getattr(_state, 'alias', None)
+
+
+@contextmanager
+def use_primary():
+    """
+    Читает из основной базы внутри блока. Нужен там, где прочитанное
+    сохраняется в общий кэш под текущей версией данных.
+    """
+    alias = get_replica()
+    _state.alias = None
+    try:
+        yield
+    finally:
+        _state.alias = alias
+
+
+def is_healthy(alias):
+    """
+    Проверяет соединение не чаще раза в `DB_HEALTH_CHECK_INTERVAL`
+    секунд и закрывает неисправное, чтобы следующий запрос
+    открыл новое.
+    """
+    healthy, checked_at = _health.get(alias, (True, None))
+    if (
+        checked_at is not None
+        and monotonic() - checked_at < settings.DB_HEALTH_CHECK_INTERVAL
+    ):
+        return healthy
+    connection = connections[alias]
+    try:
+        connection.ensure_connection()
+        healthy = connection.is_usable()
+    except DatabaseError:
+        healthy = False
+    if not healthy:
+        try:
+            connection.close()
+        except DatabaseError:
+            pass
+    _health[alias] = (healthy, monotonic())
+    return healthy
+
+
+@receiver(request_started)
+def check_connections(**kwargs):
+    """Проверяет постоянные соединения, оставшиеся от прошлых запросов."""
+    for alias in connections:
+        if connections[alias].connection is not None:
+            is_healthy(alias)
+
+
+def choose_replica():
+    replicas = [
+        alias for alias in settings.DATABASE_REPLICAS if is_healthy(alias)
+    ]
+    return random.choice(replicas) if replicas else None
+
+
+def reads_from_replica(view_func):
+    """Разрешено ли представлению читать с реплики."""
+    initkwargs = getattr(view_func, 'initkwargs', None) or {}
+    return initkwargs.get('read_from_replica', getattr(
+        getattr(view_func, 'cls', None), 'read_from_replica', False,
+    ))
+
+
+def get_pin_key(request):
+    """Ключ отметки по токену или сессии клиента."""
+    credentials = (
+        request.META.get('HTTP_AUTHORIZATION')
+        or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    if not credentials:
+        return None
+    return f'db:pinned:{md5(credentials.encode()).hexdigest()}'
+
+
+class ReplicaRouter:
+    """Чтения запроса - на выбранную реплику, остальное - в основную."""
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_ONLY_APPS:
+            return DEFAULT_DB_ALIAS
+        return get_replica()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaMiddleware:
+    """Выбирает базу для чтения и отмечает клиентов после записи."""
+    def __init__(self, get_response):
+        if settings.DATABASE_REPLICAS and not is_shared():
+            raise ImproperlyConfigured(
+                'Для чтения с реплик нужен общий кэш: отметки клиентов '
+                'после записи должны быть видны всем воркерам.'
+            )
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _state.alias = None
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.alias = None
+        if request.method not in SAFE_METHODS:
+            key = get_pin_key(request)
+            if key is not None:
+                cache.set(key, True, settings.REPLICA_PIN_SECONDS)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            settings.DATABASE_REPLICAS
+            and request.method in SAFE_METHODS
+            and reads_from_replica(view_func)
+            and not self.is_pinned(request)
+        ):
+            _state.alias = choose_replica()
+
+    def is_pinned(self, request):
+        key = get_pin_key(request)
+        return key is not None and cache.get(key) is not None
@@ -20,4 +20,18 @@ class Limits(IntEnum):
     # Минимальное время приготовления рецепта в минутах
     # и количество ингридиента в рецепте
     MIN_COOKING_TIME_AND_AMOUNT = 1
+    # Максимальное количество подсказок при поиске ингредиента
+    MAX_INGREDIENT_SUGGESTIONS = 50
+    # Максимальное количество рецептов в одном пакетном запросе
+    MAX_BATCH_RECIPES = 100
+    # Максимальное количество результатов поиска рецептов без Postgres
+    MAX_SEARCH_RESULTS = 1000
+    # Максимальное количество ингредиентов при подборе рецептов
+    MAX_MATCH_INGREDIENTS = 500
+    # Максимальное количество подобранных по ингредиентам рецептов
+    MAX_MATCH_RESULTS = 1000
+    # Максимальное количество рецептов на странице ленты подписок
+    MAX_FEED_PAGE_SIZE = 50
+    # Максимальное количество id, передаваемых в фильтр списком
+    MAX_FILTER_IDS = 500
     # Минимальное количество ингридиентов для рецепта
@@ -0,0 +1,368 @@
+"""
+Метрики запросов в формате Prometheus: гистограмма времени ответа,
+число и время SQL-запросов, размер и статусы ответов по маршрутам.
+
+Каждый процесс gunicorn копит метрики у себя и раз в
+`METRICS_FLUSH_INTERVAL` секунд записывает накопленные итоги
+в свой файл в `METRICS_DIR`. Эндпоинт `/metrics` суммирует файлы
+всех процессов, а итоги завершившихся процессов переносит в общий
+файл, чтобы счётчики не уменьшались и файлы не копились.
+"""
+import atexit
+import fcntl
+import json
+import os
+from bisect import bisect_left
+from collections import deque
+from contextlib import ExitStack
+from threading import Lock
+from time import monotonic, perf_counter
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+
+UNRESOLVED_ROUTE = '<unresolved>'
+# Границы корзин гистограммы времени ответа, секунды.
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+# Значения ряда: число ответов в каждой корзине и сверх последней,
+# затем суммы и общее количество.
+BUCKETS = len(LATENCY_BUCKETS) + 1
+SUM, QUERIES, DB_TIME, SIZE, COUNT = range(BUCKETS, BUCKETS + 5)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+FILE_PREFIX = 'metrics_'
+# Итоги завершившихся процессов.
+DEAD_FILE = f'{FILE_PREFIX}dead.json'
+LOCK_FILE = '.lock'
+
+
+class QueryCounter:
+    """Обёртка `execute_wrapper`, считающая SQL-запросы и их время."""
+    __slots__ = ('count', 'duration')
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += perf_counter() - start
+            self.count += 1
+
+
+class WorkerMetrics:
+    """
+    Метрики одного процесса. Обработчик запроса только добавляет
+    замер в очередь без блокировок, разбор очереди и запись в файл
+    выполняет тот поток, которому первым пришло время сброса.
+    """
+    def __init__(self, directory, flush_interval):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._pending = deque()
+        self._flush_lock = Lock()
+        self._flushed_at = monotonic()
+        self._pid = None
+        self.reset()
+
+    def reset(self):
+        # (маршрут, метод) -> значения ряда
+        self.series = {}
+        # (маршрут, метод, статус) -> количество ответов
+        self.statuses = {}
+
+    @property
+    def path(self):
+        return os.path.join(
+            self.directory, f'{FILE_PREFIX}{os.getpid()}.json',
+        )
+
+    def record(self, route, method, status, duration, queries, db_time,
+               size):
+        self._pending.append(
+            (route, method, status, duration, queries, db_time, size)
+        )
+        if monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def aggregate(self):
+        pending = self._pending
+        while pending:
+            (
+                route, method, status, duration, queries, db_time, size,
+            ) = pending.popleft()
+            series = self.series.get((route, method))
+            if series is None:
+                series = self.series[route, method] = [0] * (COUNT + 1)
+            series[bisect_left(LATENCY_BUCKETS, duration)] += 1
+            series[SUM] += duration
+            series[QUERIES] += queries
+            series[DB_TIME] += db_time
+            series[SIZE] += size
+            series[COUNT] += 1
+            key = (route, method, status)
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+
+    def flush(self):
+        """Записывает накопленные итоги процесса в его файл."""
+        if not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            if self._pid != os.getpid():
+                # Процесс создан форком: итоги родителя уже записаны.
+                self._pid = os.getpid()
+                self.reset()
+            self.aggregate()
+            self._flushed_at = monotonic()
+            if not self.series:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            write_file(self.path, self.series, self.statuses)
+        finally:
+            self._flush_lock.release()
+
+
+worker_metrics = WorkerMetrics(
+    settings.METRICS_DIR, settings.METRICS_FLUSH_INTERVAL,
+)
+atexit.register(worker_metrics.flush)
+
+
+def write_file(path, series, statuses):
+    """Атомарно записывает итоги в файл `path`."""
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as file:
+        json.dump({
+            'series': [
+                [route, method, values]
+                for (route, method), values in series.items()
+            ],
+            'statuses': [
+                [route, method, status, count]
+                for (route, method, status), count in statuses.items()
+            ],
+        }, file)
+    os.replace(temporary, path)
+
+
+def merge(path, series, statuses):
+    """Прибавляет итоги из файла `path`. False, если файл не прочитан."""
+    try:
+        with open(path) as file:
+            data = json.load(file)
+    except (OSError, ValueError):
+        return False
+    for route, method, values in data['series']:
+        total = series.setdefault((route, method), [0] * len(values))
+        for position, value in enumerate(values):
+            total[position] += value
+    for route, method, status, count in data['statuses']:
+        key = (route, method, status)
+        statuses[key] = statuses.get(key, 0) + count
+    return True
+
+
+def get_pid(name):
+    """PID процесса по имени его файла или None для общих файлов."""
+    pid = name[len(FILE_PREFIX):-len('.json')]
+    return int(pid) if pid.isdigit() else None
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def fold_dead(directory, names):
+    """
+    Переносит итоги завершившихся процессов в `DEAD_FILE` и удаляет
+    их файлы. Возвращает имена оставшихся файлов процессов.
+    """
+    dead = [
+        name for name in names
+        if get_pid(name) is not None and not is_alive(get_pid(name))
+    ]
+    if not dead:
+        return names
+    dead_path = os.path.join(directory, DEAD_FILE)
+    series = {}
+    statuses = {}
+    merge(dead_path, series, statuses)
+    for name in dead:
+        merge(os.path.join(directory, name), series, statuses)
+    write_file(dead_path, series, statuses)
+    for name in dead:
+        os.remove(os.path.join(directory, name))
+    return [name for name in names if name not in dead] + (
+        [] if DEAD_FILE in names else [DEAD_FILE]
+    )
+
+
+def collect(directory):
+    """
+    Суммирует итоги всех процессов из файлов `directory`.
+    Выполняется под файловой блокировкой, чтобы одновременные
+    запросы к `/metrics` не перенесли итоги дважды.
+    """
+    series = {}
+    statuses = {}
+    try:
+        lock = open(os.path.join(directory, LOCK_FILE), 'a')
+    except FileNotFoundError:
+        return series, statuses
+    with lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        names = [
+            name for name in os.listdir(directory)
+            if name.startswith(FILE_PREFIX) and name.endswith('.json')
+        ]
+        for name in fold_dead(directory, names):
+            merge(os.path.join(directory, name), series, statuses)
+    return series, statuses
+
+
+def escape(value):
+    return (
+        str(value).replace('\\', '\\\\').replace('"', '\\"')
+        .replace('\n', '\\n')
+    )
+
+
+def render(series, statuses):
+    """Текст метрик в формате Prometheus."""
+    lines = [
+        '# HELP http_request_duration_seconds Время ответа.',
+        '# TYPE http_request_duration_seconds histogram',
+    ]
+    totals = []
+    for (route, method), values in sorted(series.items()):
+        labels = f'route="{escape(route)}",method="{method}"'
+        cumulative = 0
+        for position, bound in enumerate(LATENCY_BUCKETS):
+            cumulative += values[position]
+            lines.append(
+                'http_request_duration_seconds_bucket'
+                f'{{{labels},le="{bound}"}} {cumulative}'
+            )
+        lines += [
+            f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} '
+            f'{values[COUNT]}',
+            f'http_request_duration_seconds_sum{{{labels}}} {values[SUM]}',
+            'http_request_duration_seconds_count'
+            f'{{{labels}}} {values[COUNT]}',
+        ]
+        totals.append((labels, values))
+    for name, position, help_text in (
+        ('db_queries_total', QUERIES, 'SQL-запросы.'),
+        ('db_query_duration_seconds_total', DB_TIME, 'Время SQL-запросов.'),
+        ('http_response_size_bytes_total', SIZE, 'Размер ответов.'),
+    ):
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        lines += [
+            f'{name}{{{labels}}} {values[position]}'
+            for labels, values in totals
+        ]
+    lines += [
+        '# HELP http_responses_total Ответы по статусам.',
+        '# TYPE http_responses_total counter',
+    ]
+    lines += [
+        f'http_responses_total{{route="{escape(route)}",method="{method}",'
+        f'status="{status}"}} {count}'
+        for (route, method, status), count in sorted(statuses.items())
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """
+    Метрики всех процессов. Адрес не проксируется nginx
+    и доступен только внутри сети контейнеров.
+    """
+    worker_metrics.flush()
+    return HttpResponse(
+        render(*collect(worker_metrics.directory)),
+        content_type=CONTENT_TYPE,
+    )
+
+
+class MeteredStream:
+    """
+    Содержимое потокового ответа. Запросы к БД при его чтении
+    продолжают считаться, а замер записывается при закрытии ответа.
+    """
+    def __init__(self, content, counter, finish):
+        self.content = content
+        self.counter = counter
+        self.finish = finish
+        self.size = 0
+        self._iterator = None
+        self._closed = False
+
+    def __iter__(self):
+        self._iterator = self.stream()
+        return self._iterator
+
+    def stream(self):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self.counter))
+            for chunk in self.content:
+                self.size += len(chunk)
+                yield chunk
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._iterator is not None:
+            self._iterator.close()
+        self.finish(self.size)
+
+
+class MetricsMiddleware:
+    """
+    Замеряет время ответа, SQL-запросы и размер ответа. Маршрут
+    берётся из имени представления, чтобы id в адресе не плодили
+    отдельные ряды метрик. Потоковые ответы замеряются до закрытия.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        start = perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+
+        def finish(size):
+            match = request.resolver_match
+            worker_metrics.record(
+                match.view_name if match else UNRESOLVED_ROUTE,
+                request.method,
+                response.status_code,
+                perf_counter() - start,
+                counter.count,
+                counter.duration,
+                size,
+            )
+
+        if response.streaming:
+            response.streaming_content = MeteredStream(
+                response.streaming_content, counter, finish,
+            )
+        else:
+            finish(len(response.content))
+        return response
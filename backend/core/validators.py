@@ -5,49 +5,55 @@ from recipes.models import Ingredient, Tag
 
 
 def validate_ingredients(ingredients):
-    """Валидация ингредиентов и количества."""
+    """
+    Валидация ингредиентов и количества.
+    Все id проверяются одним запросом, в результате вместо id
+    подставляются найденные объекты ингредиентов.
+    """
     if not ingredients:
         raise ValidationError('Не переданы ингредиенты.')
 
-    unique_ingredient = []
-    for ingredient in ingredients:
-        if not ingredient.get('id'):
-            raise ValidationError('Отсутствует id ингредиента.')
-
-        ingredient_id = ingredient.get('id')
-        if not Ingredient.objects.filter(id=ingredient_id).exists():
-            raise ValidationError('Ингредиента нет в БД.')
-
-        if ingredient_id in unique_ingredient:
-            raise ValidationError(
-                'Нельзя дублировать имена ингредиентов.'
-            )
-        unique_ingredient.append(ingredient_id)
+    ingredient_ids = [ingredient.get('id') for ingredient in ingredients]
+    unique_ids = set(ingredient_ids)
+    if len(unique_ids) != len(ingredient_ids):
+        raise ValidationError(
+            'Нельзя дублировать имена ингредиентов.'
+        )
 
+    for ingredient in ingredients:
         amount = int(ingredient.get('amount'))
         if amount < 1:
             raise ValidationError(
                 f"""Количество не может быть менее
                 {Limits.MIN_COOKING_TIME_AND_AMOUNT}"""
             )
-    return ingredients
+
+    found = Ingredient.objects.in_bulk(unique_ids)
+    if len(found) != len(unique_ids):
+        raise ValidationError('Ингредиента нет в БД.')
+    return [
+        {**ingredient, 'id': found[ingredient['id']]}
+        for ingredient in ingredients
+    ]
 
 
 def validate_tags(tags):
-    """Валидация тэгов: отсутствие в request, отсутствие в БД."""
+    """
+    Валидация тэгов: отсутствие в request, отсутствие в БД.
+    Возвращает объекты тэгов, найденные одним запросом.
+    """
     if not tags:
         raise ValidationError('Хотя бы один тэг должен быть указан.')
 
-    tags_list = []
-    for tag in tags:
-        if not Tag.objects.filter(id=tag).exists():
-            raise ValidationError('Тэг отсутствует в БД.')
-        if tag in tags_list:
-            raise ValidationError(
-                'Тэги должны быть уникальными!'
-            )
-        tags_list.append(tag)
-    return tags
+    unique_tags = set(tags)
+    if len(unique_tags) != len(tags):
+        raise ValidationError(
+            'Тэги должны быть уникальными!'
+        )
+    found = Tag.objects.in_bulk(unique_tags)
+    if len(found) != len(unique_tags):
+        raise ValidationError('Тэг отсутствует в БД.')
+    return [found[tag] for tag in tags]
 
 
 def validate_time(cooking_time):
@@ -1,3 +1,5 @@
+from contextlib import contextmanager
+
 from django.contrib.admin import (
     ModelAdmin,
     register,
@@ -6,14 +8,30 @@ from django.contrib.admin import (
 )
 from django.utils.safestring import mark_safe
 
+from core.counters import CounterAdminMixin, change_counter
 from recipes.models import (
     Recipe, Ingredient, ShoppingCart, Favorite, Tag, IngredientAmount,
+    ShoppingCartTotal,
 )
+from users.models import User
 
 site.site_header = 'Администрирование Foodgram-project-react'
 EMPTY_VALUE_DISPLAY = '--пусто--'
 
 
+@contextmanager
+def change_cart_totals(recipe_ids):
+    """
+    Сдвигает итоги списков покупок на изменение ингредиентов
+    рецептов `recipe_ids` внутри блока.
+    """
+    totals = ShoppingCartTotal.objects
+    old_amounts = {pk: totals.get_recipe_amounts(pk) for pk in recipe_ids}
+    yield
+    for pk, amounts in old_amounts.items():
+        totals.change_recipe(pk, amounts, totals.get_recipe_amounts(pk))
+
+
 class IngredientInline(TabularInline):
     model = IngredientAmount
 
@@ -37,15 +55,34 @@ class RecipeAdmin(ModelAdmin):
     empty_value_display = EMPTY_VALUE_DISPLAY
 
     def count_favorites(self, obj):
-        return obj.in_favorites.count()
+        return obj.favorites_count
 
     count_favorites.short_description = 'В избранном'
+    count_favorites.admin_order_field = 'favorites_count'
 
     def get_image(self, obj):
         return mark_safe(f'<img src={obj.image.url} width="80" hieght="30"')
 
     get_image.short_description = 'Изображение'
 
+    def save_model(self, request, obj, form, change):
+        """
+        Счётчик рецептов автора. При удалении рецепта его уменьшает
+        сигнал, потому что рецепты удаляются и вместе с автором.
+        """
+        if change:
+            old_author_id = Recipe.objects.values_list(
+                'author_id', flat=True,
+            ).get(pk=obj.pk)
+            change_counter(User, old_author_id, 'recipes_count', -1)
+        super().save_model(request, obj, form, change)
+        change_counter(User, obj.author_id, 'recipes_count')
+
+    def save_related(self, request, form, formsets, change):
+        """Ингредиенты из формы рецепта меняют итоги списков покупок."""
+        with change_cart_totals([form.instance.pk]):
+            super().save_related(request, form, formsets, change)
+
 
 @register(Ingredient)
 class IngredientAdmin(ModelAdmin):
@@ -56,15 +93,35 @@ class IngredientAdmin(ModelAdmin):
 
 @register(IngredientAmount)
 class IngredientAmountAdmin(ModelAdmin):
+    """Изменения ингредиентов рецепта сдвигают итоги списков покупок."""
     list_display = ('id', 'recipe', 'ingredient', 'amount')
     empty_value_display = EMPTY_VALUE_DISPLAY
 
+    def save_model(self, request, obj, form, change):
+        recipe_ids = {obj.recipe_id}
+        if change:
+            recipe_ids.add(IngredientAmount.objects.get(pk=obj.pk).recipe_id)
+        with change_cart_totals(recipe_ids):
+            super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        with change_cart_totals([obj.recipe_id]):
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = set(queryset.values_list('recipe_id', flat=True))
+        with change_cart_totals(recipe_ids):
+            super().delete_queryset(request, queryset)
+
 
 @register(Favorite)
-class FavoutriteAdmin(ModelAdmin):
+class FavoutriteAdmin(CounterAdminMixin, ModelAdmin):
     list_display = ('id', 'user', 'recipe')
     search_fields = ('user__username', 'recipe__name')
     empty_value_display = EMPTY_VALUE_DISPLAY
+    counter_model = Recipe
+    counter = 'favorites_count'
+    counter_field = 'recipe'
 
 
 @register(Tag)
@@ -75,6 +132,34 @@ class TagAdmin(ModelAdmin):
 
 
 @register(ShoppingCart)
-class ShoppingCartAdmin(ModelAdmin):
+class ShoppingCartAdmin(CounterAdminMixin, ModelAdmin):
+    """Итоги списков покупок меняются вместе со строками списка."""
     list_display = ('id', 'user', 'recipe')
     empty_value_display = EMPTY_VALUE_DISPLAY
+    counter_model = Recipe
+    counter = 'carts_count'
+    counter_field = 'recipe'
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            old = ShoppingCart.objects.select_related('user').get(pk=obj.pk)
+            ShoppingCartTotal.objects.remove_recipe(old.user, old.recipe_id)
+        super().save_model(request, obj, form, change)
+        ShoppingCartTotal.objects.add_recipe(obj.user, obj.recipe_id)
+
+    def delete_model(self, request, obj):
+        ShoppingCartTotal.objects.remove_recipe(obj.user, obj.recipe_id)
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        for cart in queryset.select_related('user'):
+            ShoppingCartTotal.objects.remove_recipe(cart.user, cart.recipe_id)
+        super().delete_queryset(request, queryset)
+
+
+@register(ShoppingCartTotal)
+class ShoppingCartTotalAdmin(ModelAdmin):
+    list_display = ('id', 'user', 'ingredient', 'amount')
+    search_fields = ('user__username', 'ingredient__name')
+    list_select_related = ('user', 'ingredient')
+    empty_value_display = EMPTY_VALUE_DISPLAY
@@ -0,0 +1,72 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from recipes.models import FeedItem
+from users.models import User
+
+logger = logging.getLogger(__name__)
+
+executor = (
+    ThreadPoolExecutor(
+        max_workers=settings.FEED_WORKERS,
+        thread_name_prefix='feeds',
+    )
+    if settings.FEED_WORKERS else None
+)
+
+
+def fan_out(recipe_id):
+    """Раскладывает рецепт по лентам подписчиков автора."""
+    try:
+        FeedItem.objects.fan_out(recipe_id)
+    except Exception:
+        logger.exception(
+            'Не удалось разложить рецепт %s по лентам', recipe_id,
+        )
+    finally:
+        if executor is not None:
+            connection.close()
+
+
+def fill_author(author_id):
+    """Добавляет рецепты автора в ленты всех его подписчиков."""
+    try:
+        FeedItem.objects.fill_author(author_id)
+    except Exception:
+        logger.exception(
+            'Не удалось добавить рецепты автора %s в ленты', author_id,
+        )
+    finally:
+        if executor is not None:
+            connection.close()
+
+
+def schedule(function, *args):
+    """
+    Выполняет `function` в фоновом пуле после фиксации транзакции.
+    Без пула (`FEED_WORKERS = 0`) - сразу после фиксации.
+    """
+    if executor is None:
+        transaction.on_commit(lambda: function(*args))
+    else:
+        transaction.on_commit(lambda: executor.submit(function, *args))
+
+
+def schedule_fan_out(recipe):
+    schedule(fan_out, recipe.pk)
+
+
+def schedule_fill_on_unfollow(author_id):
+    """
+    Если после отписки у автора осталось ровно `FEED_FANOUT_LIMIT`
+    подписчиков, его рецепты снова раскладываются по лентам, и те,
+    что вышли, пока он был выше порога, добавляются подписчикам.
+    Вызывается в транзакции отписки после уменьшения счётчика.
+    """
+    if User.objects.filter(
+        pk=author_id, followers_count=settings.FEED_FANOUT_LIMIT,
+    ).exists():
+        schedule(fill_author, author_id)
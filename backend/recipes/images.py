@@ -0,0 +1,132 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps, features
+
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+RESIZED_DIR = 'recipe_images/resized/'
+
+executor = (
+    ThreadPoolExecutor(
+        max_workers=settings.RECIPE_IMAGE_WORKERS,
+        thread_name_prefix='recipe-images',
+    )
+    if settings.RECIPE_IMAGE_WORKERS else None
+)
+
+
+def get_image_format():
+    """WebP, если Pillow собран с его поддержкой, иначе JPEG."""
+    if settings.RECIPE_IMAGE_FORMAT == 'WEBP' and features.check('webp'):
+        return 'WEBP', 'webp'
+    return 'JPEG', 'jpg'
+
+
+def get_resized_name(image_name, field, extension):
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    return f'{RESIZED_DIR}{stem}_{field}.{extension}'
+
+
+def is_resized(recipe):
+    """Уменьшенные копии уже построены для текущего изображения."""
+    return all(
+        getattr(recipe, field).name == get_resized_name(
+            recipe.image.name, field, get_image_format()[1],
+        )
+        for field in settings.RECIPE_IMAGE_SIZES
+    )
+
+
+def encode(image, image_format):
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    buffer = BytesIO()
+    image.save(buffer, image_format, quality=settings.RECIPE_IMAGE_QUALITY)
+    return buffer.getvalue()
+
+
+def delete_files(names):
+    """Удаляет файлы из хранилища, пропуская пустые имена."""
+    for name in names:
+        if not name:
+            continue
+        try:
+            default_storage.delete(name)
+        except Exception:
+            logger.exception('Не удалось удалить файл %s', name)
+
+
+def resize_recipe_image(recipe_id, image_name):
+    """
+    Строит уменьшенные копии изображения и сохраняет ссылки на них,
+    если за это время изображение рецепта не поменялось. Копии
+    прежнего изображения удаляются, а если рецепт уже удалён или
+    получил другое изображение - только что построенные.
+    """
+    try:
+        with default_storage.open(image_name) as file:
+            original = ImageOps.exif_transpose(Image.open(file))
+            original.load()
+        image_format, extension = get_image_format()
+        resized = {}
+        for field, size in settings.RECIPE_IMAGE_SIZES.items():
+            image = original.copy()
+            image.thumbnail(size, Image.LANCZOS)
+            name = get_resized_name(image_name, field, extension)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            resized[field] = default_storage.save(
+                name, ContentFile(encode(image, image_format)),
+            )
+        recipe = Recipe.objects.filter(pk=recipe_id, image=image_name)
+        previous = recipe.values_list(*resized).first() or ()
+        if recipe.update(**resized):
+            delete_files(set(previous) - set(resized.values()))
+        else:
+            delete_files(resized.values())
+    except Exception:
+        logger.exception(
+            'Не удалось уменьшить изображение рецепта %s', recipe_id,
+        )
+    finally:
+        if executor is not None:
+            connection.close()
+
+
+def schedule_resize(recipe):
+    """
+    Ставит обработку изображения в фоновый пул после фиксации
+    транзакции. Без пула (`RECIPE_IMAGE_WORKERS = 0`) обработка
+    выполняется сразу.
+    """
+    if not recipe.image or is_resized(recipe):
+        return
+    args = (recipe.pk, recipe.image.name)
+    if executor is None:
+        transaction.on_commit(lambda: resize_recipe_image(*args))
+    else:
+        transaction.on_commit(lambda: executor.submit(
+            resize_recipe_image, *args,
+        ))
+
+
+def schedule_delete_resized(recipe):
+    """Удаляет уменьшенные копии удалённого рецепта после фиксации."""
+    names = [
+        getattr(recipe, field).name for field in settings.RECIPE_IMAGE_SIZES
+    ]
+    if executor is None:
+        transaction.on_commit(lambda: delete_files(names))
+    else:
+        transaction.on_commit(lambda: executor.submit(delete_files, names))
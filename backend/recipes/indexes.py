@@ -0,0 +1,403 @@
+import json
+import re
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from hashlib import md5
+from heapq import nlargest
+from itertools import islice
+from sys import intern
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from core.cache import get_changes, get_version, is_shared
+from core.db_router import use_primary
+from core.enums import Limits
+from recipes.models import Ingredient, IngredientAmount, Recipe, Tag
+
+INGREDIENTS_VERSION_KEY = 'ingredients:version'
+RECIPES_VERSION_KEY = 'recipes:version'
+TAGS_VERSION_KEY = 'tags:version'
+MAX_CHAR = chr(0x10FFFF)
+TOKEN_RE = re.compile(r'\w+')
+# Вес слова в зависимости от того, где оно встретилось.
+NAME_WEIGHT = 3
+INGREDIENT_WEIGHT = 2
+TEXT_WEIGHT = 1
+
+
+def normalize(value):
+    """Приводит строку к виду для сравнения без учёта регистра и `ё`."""
+    return value.strip().casefold().replace('ё', 'е')
+
+
+def tokenize(value):
+    """Слова строки в нормализованном виде."""
+    return TOKEN_RE.findall(normalize(value))
+
+
+def get_recipes_marker():
+    """
+    Отметка рецептов для проверки без общего кэша: меняется при
+    добавлении, удалении и сохранении рецепта.
+    """
+    return Recipe.objects.aggregate(Max('id'), Count('id'), Max('updated'))
+
+
+def make_etag(*parts):
+    """Сильный ETag: хэш от содержимого ответа."""
+    content = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return f'"{md5(content.encode()).hexdigest()}"'
+
+
+class VersionedIndex:
+    """
+    Данные в памяти процесса, построенные по основной БД.
+    Перестраиваются при первом обращении после смены версии
+    `version_key` в кэше. Индексы с `_update` обновляют только
+    изменённые объекты, если для всех пропущенных версий в кэше
+    есть списки изменений. Если кэш не общий, версии из управляющих
+    команд до процесса не доходят, поэтому индексы с `_get_marker`
+    раз в `INDEX_CHECK_INTERVAL` секунд сверяют отметку в БД.
+    """
+    version_key = None
+    empty = None
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._data = self.empty
+        self._marker = None
+        self._checked_at = None
+
+    def _build(self):
+        raise NotImplementedError
+
+    def _update(self, data, changes):
+        """
+        Обновляет данные по id изменённых объектов. False, если
+        индекс так не умеет и его нужно перестроить.
+        """
+        return False
+
+    def _get_marker(self):
+        """Значение, меняющееся при изменении данных, или None."""
+
+    def _check_marker(self):
+        if is_shared() or (
+            self._checked_at is not None
+            and monotonic() - self._checked_at < settings.INDEX_CHECK_INTERVAL
+        ):
+            return
+        self._checked_at = monotonic()
+        with use_primary():
+            marker = self._get_marker()
+        if marker != self._marker:
+            self._marker = marker
+            self._version = None
+
+    def _get_data(self):
+        self._check_marker()
+        version = get_version(self.version_key)
+        if version != self._version:
+            with self._lock, use_primary():
+                if version != self._version:
+                    changes = None
+                    if self._version is not None:
+                        changes = get_changes(
+                            self.version_key, self._version, version,
+                        )
+                    # Если обновление прервётся, индекс перестроится.
+                    self._version = None
+                    if changes is None or not self._update(
+                        self._data, changes,
+                    ):
+                        self._data = self._build()
+                    self._version = version
+        return self._data
+
+    def warm(self):
+        """Строит индекс заранее, чтобы первый запрос не ждал загрузки."""
+        self._get_data()
+
+
+class IngredientIndex(VersionedIndex):
+    """
+    Индекс ингредиентов в памяти процесса.
+    Отсортированный массив нормализованных названий позволяет искать
+    по префиксу через bisect без обращения к БД. Индекс перестраивается,
+    когда меняется версия ингредиентов в кэше.
+    """
+    version_key = INGREDIENTS_VERSION_KEY
+    empty = ((), (), None)
+
+    def _get_marker(self):
+        """Ингредиенты только добавляются командой `import_ingrs`."""
+        return Ingredient.objects.aggregate(Max('id'), Count('id'))
+
+    def _build(self):
+        ingredients = Ingredient.objects.values(
+            'id', 'name', 'measurement_unit',
+        )
+        entries = sorted(
+            ((normalize(item['name']), item) for item in ingredients),
+            key=lambda entry: (entry[0], entry[1]['measurement_unit']),
+        )
+        items = tuple(item for _, item in entries)
+        return (
+            tuple(key for key, _ in entries),
+            items,
+            make_etag(items),
+        )
+
+    def all(self):
+        """Все ингредиенты в алфавитном порядке."""
+        return list(self._get_data()[1])
+
+    def etag(self, query=''):
+        """ETag списка или результата поиска по `query`."""
+        return make_etag(self._get_data()[2], normalize(query))
+
+    def search(self, query, limit=Limits.MAX_INGREDIENT_SUGGESTIONS.value):
+        """
+        Ищет ингредиенты по названию: сначала совпадения по началу
+        названия, затем по вхождению подстроки. Не более `limit` штук.
+        """
+        query = normalize(query)
+        keys, items, _ = self._get_data()
+        start = bisect_left(keys, query)
+        end = min(bisect_left(keys, query + MAX_CHAR, start), start + limit)
+        result = list(items[start:end])
+        if len(result) < limit:
+            result.extend(islice(
+                (
+                    item for key, item in zip(keys, items)
+                    if query in key and not key.startswith(query)
+                ),
+                limit - len(result),
+            ))
+        return result
+
+
+ingredient_index = IngredientIndex()
+
+
+class TagRegistry(VersionedIndex):
+    """
+    Теги в памяти процесса: загружаются одним запросом и
+    перезагружаются, когда меняется версия тегов в кэше.
+    """
+    version_key = TAGS_VERSION_KEY
+    empty = ((), {}, None)
+
+    def _build(self):
+        tags = tuple(Tag.objects.values('id', 'name', 'color', 'slug'))
+        return tags, {tag['id']: tag for tag in tags}, make_etag(tags)
+
+    def all(self):
+        """Все теги в порядке названий."""
+        return list(self._get_data()[0])
+
+    def get(self, tag_id):
+        """Тег по id или None."""
+        return self._get_data()[1].get(tag_id)
+
+    def get_ids(self, slugs):
+        """id тегов с указанными slug."""
+        slugs = set(slugs)
+        return [tag['id'] for tag in self._get_data()[0]
+                if tag['slug'] in slugs]
+
+    def choices(self):
+        """Варианты для фильтра: (slug, название)."""
+        return [(tag['slug'], tag['name']) for tag in self._get_data()[0]]
+
+    def etag(self):
+        return self._get_data()[2]
+
+
+tag_registry = TagRegistry()
+
+
+class RecipeSearchIndex(VersionedIndex):
+    """
+    Инвертированный индекс рецептов в памяти процесса для баз без
+    полнотекстового поиска (SQLite в разработке и тестах). Для каждого
+    слова хранит рецепты и вес совпадения: в названии слово весит
+    больше, чем в ингредиентах и описании. Для каждого рецепта
+    хранятся его слова, чтобы изменённый рецепт можно было
+    переиндексировать отдельно.
+    """
+    version_key = RECIPES_VERSION_KEY
+    empty = ({}, {})
+
+    def _get_marker(self):
+        return get_recipes_marker()
+
+    def _load(self, postings, tokens, recipe_ids=None):
+        """Добавляет слова рецептов в индекс."""
+        recipes = Recipe.objects.values_list('id', 'name', 'text').order_by()
+        amounts = IngredientAmount.objects.values_list(
+            'recipe_id', 'ingredient__name',
+        ).order_by()
+        if recipe_ids is not None:
+            recipes = recipes.filter(id__in=recipe_ids)
+            amounts = amounts.filter(recipe_id__in=recipe_ids)
+
+        def add(recipe_id, value, weight):
+            for token in tokenize(value):
+                # Одна строка на слово во всех рецептах.
+                token = intern(token)
+                posting = postings.setdefault(token, {})
+                if recipe_id not in posting:
+                    tokens.setdefault(recipe_id, []).append(token)
+                posting[recipe_id] = posting.get(recipe_id, 0) + weight
+
+        for recipe_id, name, text in recipes.iterator():
+            add(recipe_id, name, NAME_WEIGHT)
+            add(recipe_id, text, TEXT_WEIGHT)
+        for recipe_id, name in amounts.iterator():
+            add(recipe_id, name, INGREDIENT_WEIGHT)
+
+    def _build(self):
+        postings = {}
+        tokens = {}
+        self._load(postings, tokens)
+        return postings, {
+            recipe_id: tuple(recipe_tokens)
+            for recipe_id, recipe_tokens in tokens.items()
+        }
+
+    def _update(self, data, changes):
+        postings, tokens = data
+        for recipe_id in changes:
+            for token in tokens.pop(recipe_id, ()):
+                posting = postings.get(token)
+                if posting is not None:
+                    posting.pop(recipe_id, None)
+                    if not posting:
+                        del postings[token]
+        if changes:
+            added = {}
+            self._load(postings, added, changes)
+            for recipe_id, recipe_tokens in added.items():
+                tokens[recipe_id] = tuple(recipe_tokens)
+        return True
+
+    def search(self, query, limit=Limits.MAX_SEARCH_RESULTS.value):
+        """
+        id рецептов, содержащих все слова запроса, по убыванию
+        суммарного веса, при равенстве - сначала новые.
+        """
+        tokens = set(tokenize(query))
+        if not tokens:
+            return []
+        postings = self._get_data()[0]
+        matches = [postings.get(token, {}) for token in tokens]
+        matches.sort(key=len)
+        # Список снимается целиком, пока изменения рецептов
+        # применяются к словарям на месте.
+        scores = {}
+        for recipe_id, weight in list(matches[0].items()):
+            for match in matches[1:]:
+                match_weight = match.get(recipe_id)
+                if match_weight is None:
+                    break
+                weight += match_weight
+            else:
+                scores[recipe_id] = weight
+        return sorted(
+            scores, key=lambda recipe_id: (-scores[recipe_id], -recipe_id),
+        )[:limit]
+
+
+recipe_search_index = RecipeSearchIndex()
+
+
+class RecipeIngredientIndex(VersionedIndex):
+    """
+    Списки рецептов по ингредиентам для подбора рецептов
+    по имеющимся продуктам. Для каждого ингредиента хранится массив
+    id рецептов, для каждого рецепта - массив его ингредиентов.
+    Изменённые рецепты обновляются по отдельности: массивы заменяются
+    новыми, а не меняются на месте, чтобы не мешать чтению.
+    """
+    version_key = RECIPES_VERSION_KEY
+    empty = ({}, {})
+
+    def _get_marker(self):
+        return get_recipes_marker()
+
+    def _load(self, recipe_ids=None):
+        rows = IngredientAmount.objects.values_list(
+            'recipe_id', 'ingredient_id',
+        ).order_by()
+        if recipe_ids is not None:
+            rows = rows.filter(recipe_id__in=recipe_ids)
+        recipes = defaultdict(lambda: array('q'))
+        for recipe_id, ingredient_id in rows.iterator():
+            recipes[recipe_id].append(ingredient_id)
+        return recipes
+
+    def _build(self):
+        postings = defaultdict(lambda: array('q'))
+        recipes = self._load()
+        for recipe_id, ingredient_ids in recipes.items():
+            for ingredient_id in ingredient_ids:
+                postings[ingredient_id].append(recipe_id)
+        return dict(postings), dict(recipes)
+
+    def _update(self, data, changes):
+        postings, recipes = data
+        if not changes:
+            return True
+        loaded = self._load(changes)
+        removed = defaultdict(set)
+        added = defaultdict(list)
+        for recipe_id in changes:
+            for ingredient_id in recipes.get(recipe_id, ()):
+                removed[ingredient_id].add(recipe_id)
+            for ingredient_id in loaded.get(recipe_id, ()):
+                added[ingredient_id].append(recipe_id)
+        for ingredient_id in removed.keys() | added.keys():
+            posting = array('q', (
+                recipe_id for recipe_id in postings.get(ingredient_id, ())
+                if recipe_id not in removed[ingredient_id]
+            ))
+            posting.extend(added[ingredient_id])
+            if posting:
+                postings[ingredient_id] = posting
+            else:
+                postings.pop(ingredient_id, None)
+        for recipe_id in changes:
+            if recipe_id in loaded:
+                recipes[recipe_id] = loaded[recipe_id]
+            else:
+                recipes.pop(recipe_id, None)
+        return True
+
+    def match(self, ingredient_ids, min_coverage=0,
+              limit=Limits.MAX_MATCH_RESULTS.value):
+        """
+        Не более `limit` пар (id рецепта, доля его ингредиентов
+        из `ingredient_ids`) с долей не меньше `min_coverage`,
+        по убыванию доли, при равенстве - сначала новые.
+        """
+        postings, recipes = self._get_data()
+        matched = Counter()
+        for ingredient_id in set(ingredient_ids):
+            matched.update(postings.get(ingredient_id, ()))
+        results = []
+        for recipe_id, count in matched.items():
+            ingredients = recipes.get(recipe_id)
+            if ingredients and count >= min_coverage * len(ingredients):
+                results.append((recipe_id, count / len(ingredients)))
+        return nlargest(
+            limit, results, key=lambda result: (result[1], result[0]),
+        )
+
+
+recipe_ingredient_index = RecipeIngredientIndex()
@@ -0,0 +1,370 @@
+import base64
+import io
+import json
+import os
+import tempfile
+from contextlib import ExitStack
+from itertools import product
+from statistics import median_low
+from time import perf_counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import (
+    CaptureQueriesContext,
+    override_settings,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.cache import bump_version
+from recipes.indexes import RECIPES_VERSION_KEY
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+BENCHMARKS_ROOT = os.path.join(settings.BASE_DIR, 'benchmarks')
+BUDGETS_FILE = os.path.join(BENCHMARKS_ROOT, 'budgets.json')
+BASELINE_FILE = os.path.join(BENCHMARKS_ROOT, 'baseline.json')
+# Замеры не попадают в метрики процессов на /metrics.
+METRICS_MIDDLEWARE = 'core.metrics.MetricsMiddleware'
+# Разница p95 с базовым замером меньше этой величины считается шумом.
+MIN_REGRESSION_MS = 1.0
+# Размер набора данных при --scale 1.
+USERS = 300
+INGREDIENTS = 1000
+RECIPES = 3000
+RECIPE_INGREDIENTS = 6
+
+
+def percentile(values, share):
+    """Значение, не больше которого `share` всех замеров."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def make_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 30), 'white').save(buffer, 'PNG')
+    return (
+        'data:image/png;base64,'
+        + base64.b64encode(buffer.getvalue()).decode()
+    )
+
+
+def load_json(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump(data, file, ensure_ascii=False, indent=2, sort_keys=True)
+        file.write('\n')
+
+
+class Command(BaseCommand):
+    """
+    Замеряет время ответа и число SQL-запросов основных эндпоинтов
+    на тестовой базе с одинаковым при каждом запуске набором данных.
+    Завершается ошибкой, если эндпоинт превысил бюджет запросов
+    из `benchmarks/budgets.json` или его p95 вырос больше чем
+    в `--threshold` раз по сравнению с `benchmarks/baseline.json`.
+    """
+    help = 'Нагрузочный замер эндпоинтов API с бюджетами запросов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations', type=int, default=20,
+            help='Число замеров каждого эндпоинта.',
+        )
+        parser.add_argument(
+            '--scale', type=int, default=1,
+            help='Множитель размера набора данных.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--case', default='',
+            help='Замерять только эндпоинты, в названии которых есть строка.',
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=1.5,
+            help='Допустимый рост p95 относительно базового замера.',
+        )
+        parser.add_argument('--budgets', default=BUDGETS_FILE)
+        parser.add_argument('--baseline', default=BASELINE_FILE)
+        parser.add_argument(
+            '--save-budgets', action='store_true',
+            help='Записать измеренное число запросов как бюджеты.',
+        )
+        parser.add_argument(
+            '--save-baseline', action='store_true',
+            help='Записать результаты как базовый замер.',
+        )
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('Нужен хотя бы один замер.')
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with tempfile.TemporaryDirectory() as media_root:
+                with override_settings(
+                    MEDIA_ROOT=media_root,
+                    MIDDLEWARE=[
+                        middleware for middleware in settings.MIDDLEWARE
+                        if middleware != METRICS_MIDDLEWARE
+                    ],
+                ):
+                    cache.clear()
+                    data = self.build_dataset(
+                        options['seed'], options['scale'],
+                    )
+                    results = self.run_cases(
+                        self.get_cases(data),
+                        options['iterations'],
+                        options['case'],
+                    )
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+        self.report(results, options)
+
+    def build_dataset(self, seed, scale):
+        """
+        Заполняет базу командой `generate_data` и выбирает читателя,
+        у которого есть рецепты, подписки и список покупок.
+        """
+        call_command(
+            'generate_data',
+            users=USERS * scale,
+            recipes=RECIPES * scale,
+            ingredients=INGREDIENTS * scale,
+            seed=seed,
+            stdout=io.StringIO(),
+        )
+        reader = User.objects.filter(
+            recipes_count__gt=0,
+            carts__isnull=False,
+            follower__isnull=False,
+        ).order_by('pk').first()
+        return {
+            'reader': reader,
+            'author': User.objects.order_by('-recipes_count', 'pk').first(),
+            'tags': list(Tag.objects.order_by('pk')),
+            'ingredients': list(Ingredient.objects.order_by('pk')[:10]),
+            'recipe': Recipe.objects.order_by('-pk').first(),
+            'own_recipe': reader.recipes.order_by('pk').first(),
+            'new_recipe': Recipe.objects.exclude(
+                in_favorites__user=reader,
+            ).exclude(in_carts__user=reader).order_by('pk').first(),
+            'followed': reader.follower.order_by('pk').first().author,
+        }
+
+    def get_client(self, user=None):
+        client = APIClient()
+        if user is not None:
+            token, _ = Token.objects.get_or_create(user=user)
+            client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+    def get_cases(self, data):
+        """
+        Название, клиент, запросы и необязательная подготовка, которая
+        выполняется перед каждым замером вне него. Запросы одного
+        эндпоинта замеряются вместе: добавление и удаление - один замер.
+        """
+        reader = self.get_client(data['reader'])
+        anonymous = self.get_client()
+        tags = data['tags']
+        recipe = data['recipe']
+        new_recipe = data['new_recipe']
+        own_recipe = data['own_recipe']
+        followed = data['followed']
+        filters = {
+            'tags': [tags[0].slug, tags[1].slug],
+            'author': data['author'].pk,
+            'is_favorited': 1,
+            'is_in_shopping_cart': 1,
+        }
+        cases = []
+        for mask in product((False, True), repeat=len(filters)):
+            params = {
+                name: value
+                for (name, value), use in zip(filters.items(), mask) if use
+            }
+            cases.append((
+                f'recipes list {"+".join(params) or "all"}', reader,
+                [('get', '/api/recipes/', params)],
+            ))
+        cases += [
+            ('recipes list anonymous', anonymous,
+             [('get', '/api/recipes/', None)]),
+            ('recipes list anonymous cold', anonymous,
+             [('get', '/api/recipes/', None)],
+             lambda: bump_version(RECIPES_VERSION_KEY)),
+            ('recipes list cursor', reader,
+             [('get', '/api/recipes/', {'pagination': 'cursor'})]),
+            ('recipes list popular', reader,
+             [('get', '/api/recipes/', {'ordering': 'popular'})]),
+            ('recipes list trending', reader,
+             [('get', '/api/recipes/', {'ordering': 'trending'})]),
+            ('recipes list search', reader,
+             [('get', '/api/recipes/', {'search': 'рецепт ингредиент'})]),
+            ('recipe detail', reader,
+             [('get', f'/api/recipes/{recipe.pk}/', None)]),
+            ('recipe detail anonymous', anonymous,
+             [('get', f'/api/recipes/{recipe.pk}/', None)]),
+            ('recipes feed', reader,
+             [('get', '/api/recipes/feed/', None)]),
+            ('ingredients search', anonymous,
+             [('get', '/api/ingredients/', {'name': 'ингредиент 1'})]),
+            ('subscriptions', reader,
+             [('get', '/api/users/subscriptions/', None)]),
+            ('subscribe toggle', reader, [
+                ('delete', f'/api/users/{followed.pk}/subscribe/', None),
+                ('post', f'/api/users/{followed.pk}/subscribe/', None),
+            ]),
+            ('favorite toggle', reader, [
+                ('post', f'/api/recipes/{new_recipe.pk}/favorite/', None),
+                ('delete', f'/api/recipes/{new_recipe.pk}/favorite/', None),
+            ]),
+            ('shopping cart toggle', reader, [
+                ('post', f'/api/recipes/{new_recipe.pk}/shopping_cart/',
+                 None),
+                ('delete', f'/api/recipes/{new_recipe.pk}/shopping_cart/',
+                 None),
+            ]),
+            ('recipe create', reader,
+             [('post', '/api/recipes/', self.get_recipe_payload(data))]),
+            ('recipe update', reader, [(
+                'patch', f'/api/recipes/{own_recipe.pk}/',
+                self.get_recipe_payload(data),
+            )]),
+            ('download shopping cart', reader,
+             [('get', '/api/recipes/download_shopping_cart/', None)]),
+        ]
+        return cases
+
+    def get_recipe_payload(self, data):
+        return {
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': make_image(),
+            'tags': [tag.pk for tag in data['tags'][:2]],
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': 100}
+                for ingredient in data['ingredients'][:RECIPE_INGREDIENTS]
+            ],
+        }
+
+    def run_cases(self, cases, iterations, case_filter):
+        """Прогревает каждый эндпоинт одним запросом и замеряет его."""
+        results = {}
+        for name, client, requests, *prepare in cases:
+            if case_filter not in name:
+                continue
+            self.measure(client, requests)
+            timings = []
+            queries = 0
+            for _ in range(iterations):
+                for function in prepare:
+                    function()
+                duration, count = self.measure(client, requests)
+                timings.append(duration)
+                queries = max(queries, count)
+            results[name] = {
+                'p50': round(median_low(timings) * 1000, 3),
+                'p95': round(percentile(timings, 0.95) * 1000, 3),
+                'queries': queries,
+            }
+        return results
+
+    def measure(self, client, requests):
+        """
+        Время запросов и число SQL-запросов ко всем базам. Потоковые
+        ответы читаются целиком внутри замера.
+        """
+        duration = 0.0
+        with ExitStack() as stack:
+            contexts = [
+                stack.enter_context(CaptureQueriesContext(connection))
+                for connection in connections.all()
+            ]
+            for method, path, payload in requests:
+                started = perf_counter()
+                if method == 'get':
+                    response = client.get(path, payload)
+                else:
+                    response = getattr(client, method)(
+                        path, payload, format='json',
+                    )
+                if response.streaming:
+                    content = b''.join(response.streaming_content)
+                    response.close()
+                else:
+                    content = response.content
+                duration += perf_counter() - started
+                if response.status_code >= 400:
+                    raise CommandError(
+                        f'{method.upper()} {path}: {response.status_code} '
+                        f'{content[:200]!r}'
+                    )
+        return duration, sum(
+            len(context.captured_queries) for context in contexts
+        )
+
+    def report(self, results, options):
+        budgets = load_json(options['budgets'])
+        baseline = load_json(options['baseline'])
+        if options['save_budgets']:
+            budgets.update(
+                (name, result['queries']) for name, result in results.items()
+            )
+            save_json(options['budgets'], budgets)
+        failures = []
+        self.stdout.write(
+            f'{"эндпоинт":<60} {"p50 мс":>9} {"p95 мс":>9} '
+            f'{"запросы":>8} {"бюджет":>7}'
+        )
+        for name, result in results.items():
+            budget = budgets.get(name)
+            shown_budget = '-' if budget is None else budget
+            self.stdout.write(
+                f'{name:<60} {result["p50"]:>9.2f} {result["p95"]:>9.2f} '
+                f'{result["queries"]:>8} {shown_budget:>7}'
+            )
+            if budget is None:
+                failures.append(f'{name}: нет бюджета запросов')
+            elif result['queries'] > budget:
+                failures.append(
+                    f'{name}: {result["queries"]} запросов '
+                    f'при бюджете {budget}'
+                )
+            base = baseline.get(name)
+            if base is not None and result['p95'] > max(
+                base['p95'] * options['threshold'],
+                base['p95'] + MIN_REGRESSION_MS,
+            ):
+                failures.append(
+                    f'{name}: p95 {result["p95"]:.2f} мс, '
+                    f'в базовом замере {base["p95"]:.2f} мс'
+                )
+        if options['save_baseline']:
+            baseline.update(results)
+            save_json(options['baseline'], baseline)
+            return
+        if failures:
+            raise CommandError('\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('Все эндпоинты в бюджете.'))
@@ -0,0 +1,369 @@
+import io
+import random
+from array import array
+from itertools import accumulate, islice
+from time import monotonic
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+
+from core.cache import bump_version
+from recipes.indexes import (
+    INGREDIENTS_VERSION_KEY,
+    RECIPES_VERSION_KEY,
+    TAGS_VERSION_KEY,
+)
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientAmount,
+    Recipe,
+    ShoppingCart,
+    Tag,
+)
+from recipes.search import is_postgres, update_search_vectors
+from users.models import Follow, User
+
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_PASSWORD = 'foodgram-password'
+PLACEHOLDER_IMAGE = 'recipe_images/generated.png'
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+    ('Выпечка', '#F2C94C', 'bakery'),
+    ('Десерт', '#EB5757', 'dessert'),
+    ('Вегетарианское', '#27AE60', 'vegetarian'),
+)
+UNITS = ('г', 'мл', 'шт.', 'ст. л.', 'ч. л.', 'по вкусу')
+# Показатели степенных распределений: чем больше, тем сильнее
+# выделяются популярные ингредиенты, теги, авторы и рецепты.
+INGREDIENT_SKEW = 1.0
+TAG_SKEW = 0.8
+AUTHOR_SKEW = 1.1
+RECIPE_SKEW = 0.9
+# Параметр распределения Парето для числа подписок и избранного
+# и его пределы: доля всех авторов или рецептов и число строк.
+ACTIVITY_SHAPE = 1.5
+MAX_ACTIVITY_SHARE = 0.1
+MAX_ACTIVITY = 1000
+MAX_RECIPE_INGREDIENTS = 25
+MAX_RECIPE_TAGS = 3
+
+
+def zipf_weights(size, skew):
+    """Накопленные веса распределения Ципфа для `rng.choices`."""
+    return array('d', accumulate(
+        1 / (rank ** skew) for rank in range(1, size + 1)
+    ))
+
+
+def sample_unique(rng, population, cum_weights, count):
+    """`count` разных элементов с учётом весов."""
+    count = min(count, len(population))
+    chosen = set()
+    while len(chosen) < count:
+        chosen.update(rng.choices(
+            population, cum_weights=cum_weights, k=count - len(chosen),
+        ))
+    return chosen
+
+
+def chunks(rows, size):
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Command(BaseCommand):
+    """
+    Заполняет базу синтетическими данными для нагрузочных замеров.
+    При одном и том же `--seed` на пустой базе данные совпадают.
+    Строки создаются генераторами и вставляются пачками в отдельных
+    транзакциях, в памяти держатся только массивы id.
+    """
+    help = 'Генерирует пользователей, рецепты, подписки, избранное и покупки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--ingredients', type=int, default=2000,
+            help='Сколько ингредиентов создать, если их нет в базе.',
+        )
+        parser.add_argument(
+            '--recipe-ingredients', type=int, default=8,
+            help='Среднее число ингредиентов в рецепте.',
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=30,
+            help='Среднее число рецептов в избранном пользователя.',
+        )
+        parser.add_argument(
+            '--follows', type=int, default=10,
+            help='Среднее число подписок пользователя.',
+        )
+        parser.add_argument(
+            '--cart', type=int, default=5,
+            help='Наибольшее число рецептов в списке покупок.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Количество строк в одной вставке и транзакции.',
+        )
+        parser.add_argument(
+            '--skip-rebuild',
+            action='store_true',
+            help=(
+                'Не пересчитывать поисковые векторы, счётчики, итоги, '
+                'рейтинг и ленты.'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+        if options['users'] < 2 or options['recipes'] < 1:
+            raise CommandError('Нужны хотя бы два пользователя и рецепт.')
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.started = monotonic()
+        tag_ids = self.get_tags()
+        ingredient_ids = self.get_ingredients(options['ingredients'])
+        user_ids = self.create_users(options['users'])
+        # Популярность не зависит от порядка id. Плодовитые и
+        # популярные авторы выбираются независимо, иначе число строк
+        # в лентах (рецепты автора x подписчики) растёт квадратично.
+        author_weights = zipf_weights(len(user_ids), AUTHOR_SKEW)
+        recipe_ids = self.create_recipes(
+            options['recipes'], self.shuffled(user_ids), author_weights,
+        )
+        self.create_recipe_links(
+            recipe_ids, ingredient_ids, tag_ids,
+            options['recipe_ingredients'],
+        )
+        self.create_follows(
+            user_ids, self.shuffled(user_ids), author_weights,
+            options['follows'],
+        )
+        recipes = self.shuffled(recipe_ids)
+        recipe_weights = zipf_weights(len(recipes), RECIPE_SKEW)
+        self.create_favorites(
+            user_ids, recipes, recipe_weights, options['favorites'],
+        )
+        self.create_carts(user_ids, recipes, recipe_weights, options['cart'])
+        if not options['skip_rebuild']:
+            self.update_search_vectors(recipe_ids)
+            for command, command_options in (
+                ('reconcile_counters', {}),
+                ('rebuild_cart_totals', {}),
+                ('refresh_trending', {'full': True}),
+                ('rebuild_feeds', {}),
+            ):
+                call_command(command, stdout=self.stdout, **command_options)
+        # bulk_create не отправляет сигналы, поэтому индексы и кэш
+        # ответов сбрасываются здесь.
+        bump_version(TAGS_VERSION_KEY)
+        bump_version(INGREDIENTS_VERSION_KEY)
+        bump_version(RECIPES_VERSION_KEY)
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные созданы за {monotonic() - self.started:.1f} с.'
+        ))
+
+    def insert(self, model, rows):
+        """Вставляет строки пачками, каждая в своей транзакции."""
+        inserted = 0
+        for chunk in chunks(rows, self.batch_size):
+            with transaction.atomic():
+                model.objects.bulk_create(chunk)
+            inserted += len(chunk)
+        self.stdout.write(
+            f'{model._meta.verbose_name_plural}: {inserted} '
+            f'({monotonic() - self.started:.1f} с)'
+        )
+
+    def update_search_vectors(self, recipe_ids):
+        """Поисковые векторы созданных рецептов, пачками."""
+        if not is_postgres():
+            return
+        for start in range(0, len(recipe_ids), self.batch_size):
+            with transaction.atomic():
+                update_search_vectors(
+                    recipe_ids[start:start + self.batch_size],
+                )
+        self.stdout.write(
+            f'Поисковые векторы: {len(recipe_ids)} '
+            f'({monotonic() - self.started:.1f} с)'
+        )
+
+    def shuffled(self, ids):
+        ids = array('q', ids)
+        self.rng.shuffle(ids)
+        return ids
+
+    def new_ids(self, model, last_id):
+        return array('q', model.objects.filter(
+            pk__gt=last_id
+        ).order_by('pk').values_list('pk', flat=True).iterator())
+
+    def get_last_id(self, model):
+        last = model.objects.order_by('-pk').values_list('pk', flat=True)
+        return last.first() or 0
+
+    def get_tags(self):
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in TAGS
+            )
+        return array('q', Tag.objects.order_by('pk').values_list(
+            'pk', flat=True,
+        ))
+
+    def get_ingredients(self, count):
+        """Ингредиенты из базы, например после `import_ingrs`."""
+        if not Ingredient.objects.exists():
+            self.insert(Ingredient, (
+                Ingredient(
+                    name=f'ингредиент {number}',
+                    measurement_unit=self.rng.choice(UNITS),
+                )
+                for number in range(count)
+            ))
+        return array('q', Ingredient.objects.order_by('pk').values_list(
+            'pk', flat=True,
+        ).iterator())
+
+    def create_users(self, count):
+        """
+        Пользователи с общим паролем `DEFAULT_PASSWORD`, чтобы под
+        ними можно было войти при нагрузочном тестировании.
+        """
+        last_id = self.get_last_id(User)
+        password = make_password(DEFAULT_PASSWORD)
+        self.insert(User, (
+            User(
+                username=f'user{last_id + number}',
+                email=f'user{last_id + number}@example.com',
+                first_name=f'Имя{number}',
+                last_name=f'Фамилия{number}',
+                password=password,
+            )
+            for number in range(1, count + 1)
+        ))
+        return self.new_ids(User, last_id)
+
+    def get_image(self):
+        if not default_storage.exists(PLACEHOLDER_IMAGE):
+            buffer = io.BytesIO()
+            Image.new('RGB', (480, 480), '#F2C94C').save(buffer, 'PNG')
+            default_storage.save(
+                PLACEHOLDER_IMAGE, ContentFile(buffer.getvalue()),
+            )
+        return PLACEHOLDER_IMAGE
+
+    def create_recipes(self, count, authors, author_weights):
+        """Авторы выбираются по степенному закону."""
+        last_id = self.get_last_id(Recipe)
+        image = self.get_image()
+        rng = self.rng
+        self.insert(Recipe, (
+            Recipe(
+                author_id=rng.choices(authors, cum_weights=author_weights)[0],
+                name=f'Рецепт {last_id + number}',
+                text=f'Описание рецепта {last_id + number}.',
+                cooking_time=rng.randint(5, 180),
+                image=image,
+            )
+            for number in range(1, count + 1)
+        ))
+        return self.new_ids(Recipe, last_id)
+
+    def create_recipe_links(self, recipe_ids, ingredient_ids, tag_ids,
+                            mean_ingredients):
+        """
+        Ингредиенты и теги рецептов: популярные ингредиенты
+        встречаются в рецептах намного чаще редких.
+        """
+        rng = self.rng
+        ingredient_weights = zipf_weights(
+            len(ingredient_ids), INGREDIENT_SKEW,
+        )
+        tag_weights = zipf_weights(len(tag_ids), TAG_SKEW)
+        self.insert(IngredientAmount, (
+            IngredientAmount(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=rng.randint(1, 500),
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in sample_unique(
+                rng, ingredient_ids, ingredient_weights,
+                max(1, min(
+                    MAX_RECIPE_INGREDIENTS,
+                    round(rng.gauss(mean_ingredients, 3)),
+                )),
+            )
+        ))
+        self.insert(Recipe.tags.through, (
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in sample_unique(
+                rng, tag_ids, tag_weights,
+                rng.randint(1, MAX_RECIPE_TAGS),
+            )
+        ))
+
+    def get_activity(self, mean, population):
+        """Число действий пользователя с тяжёлым хвостом."""
+        scale = mean * (ACTIVITY_SHAPE - 1) / ACTIVITY_SHAPE
+        return min(
+            MAX_ACTIVITY,
+            max(1, int(population * MAX_ACTIVITY_SHARE)),
+            int(scale * self.rng.paretovariate(ACTIVITY_SHAPE)),
+        )
+
+    def create_follows(self, user_ids, authors, author_weights, mean):
+        """
+        Подписки: у немногих авторов почти все подписчики,
+        у большинства - единицы.
+        """
+        self.insert(Follow, (
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id in user_ids
+            for author_id in sample_unique(
+                self.rng, authors, author_weights,
+                self.get_activity(mean, len(authors)),
+            )
+            if author_id != user_id
+        ))
+
+    def create_favorites(self, user_ids, recipes, recipe_weights, mean):
+        self.insert(Favorite, (
+            Favorite(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in sample_unique(
+                self.rng, recipes, recipe_weights,
+                self.get_activity(mean, len(recipes)),
+            )
+        ))
+
+    def create_carts(self, user_ids, recipes, recipe_weights, limit):
+        self.insert(ShoppingCart, (
+            ShoppingCart(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in sample_unique(
+                self.rng, recipes, recipe_weights,
+                self.rng.randint(0, limit),
+            )
+        ))
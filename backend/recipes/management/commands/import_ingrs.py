@@ -1,36 +1,134 @@
 import csv
+import json
 import os
+from itertools import islice
+from time import monotonic
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from core.cache import bump_version
+from recipes.indexes import INGREDIENTS_VERSION_KEY
 from recipes.models import Ingredient
 
 DATA_ROOT = os.path.join(settings.BASE_DIR, 'data')
+FORMATS = ('csv', 'json')
+DEFAULT_BATCH_SIZE = 5000
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    """Построчно читает пары `название, единица измерения` из CSV."""
+    for row in csv.reader(file):
+        if row:
+            name, measurement_unit = row
+            yield name, measurement_unit
+
+
+def read_json(file):
+    """
+    Читает JSON-массив объектов по частям, не загружая файл целиком.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    for chunk in iter(lambda: file.read(READ_CHUNK_SIZE), ''):
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in '[, \t\r\n':
+                position += 1
+            if buffer[position:position + 1] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                break
+            yield item['name'], item['measurement_unit']
+        buffer = buffer[position:]
+    if buffer.strip():
+        raise CommandError('Файл JSON оборван или повреждён.')
+
+
+READERS = {'csv': read_csv, 'json': read_json}
 
 
 class Command(BaseCommand):
     """
-    Переносим данные из csv в базу данных
+    Переносим данные из csv или json в базу данных.
+    Воркеры перестраивают индекс ингредиентов по версии в общем
+    кэше, а с кэшем в памяти процесса - по отметке в БД не позже
+    чем через `INDEX_CHECK_INTERVAL` секунд.
     """
-    help = 'Добавляем ингредиенты из файла ingredients.csv'
+    help = 'Добавляем ингредиенты из файла ingredients.csv или .json'
 
     def add_arguments(self, parser):
-        parser.add_argument('filename', default='ingredients.csv', nargs='?',
-                            type=str)
+        parser.add_argument('filename', nargs='?', type=str)
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help='Формат файла. По умолчанию определяется по расширению.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Количество строк в одной вставке и транзакции.',
+        )
+
+    def get_format(self, filename, file_format):
+        if file_format:
+            return file_format
+        extension = os.path.splitext(filename)[1].lstrip('.').lower()
+        return extension if extension in FORMATS else 'csv'
+
+    def import_rows(self, rows, batch_size):
+        """Вставляет строки пачками, пропуская уже существующие."""
+        processed = 0
+        started = monotonic()
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            with transaction.atomic():
+                Ingredient.objects.bulk_create(
+                    [
+                        Ingredient(name=name, measurement_unit=unit)
+                        for name, unit in batch
+                    ],
+                    ignore_conflicts=True,
+                )
+            processed += len(batch)
+            elapsed = monotonic() - started
+            self.stdout.write(
+                f'Обработано строк: {processed} '
+                f'({processed / max(elapsed, 0.001):.0f} строк/с)'
+            )
+        return processed, monotonic() - started
 
     def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+        file_format = options['format']
+        filename = options['filename'] or f'ingredients.{file_format or "csv"}'
+        file_format = self.get_format(filename, file_format)
+        count_before = Ingredient.objects.count()
         try:
-            with open(os.path.join(DATA_ROOT, options['filename']), 'r',
+            with open(os.path.join(DATA_ROOT, filename), 'r',
                       encoding='utf-8') as f:
-                data = csv.reader(f)
-                for row in data:
-                    name, measurement_unit = row
-                    Ingredient.objects.get_or_create(
-                        name=name,
-                        measurement_unit=measurement_unit
-                    )
+                processed, elapsed = self.import_rows(
+                    READERS[file_format](f), options['batch_size'],
+                )
         except FileNotFoundError:
             raise CommandError(
-                'Добавьте файл ingredients.csv в директорию backend/data'
+                f'Добавьте файл {filename} в директорию backend/data'
             )
+        except (KeyError, ValueError) as error:
+            raise CommandError(f'Некорректная строка в {filename}: {error}')
+        finally:
+            bump_version(INGREDIENTS_VERSION_KEY)
+        created = Ingredient.objects.count() - count_before
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: обработано {processed}, добавлено {created} '
+            f'за {elapsed:.2f} с.'
+        ))
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import ShoppingCart, ShoppingCartTotal
+
+USERS_CHUNK_SIZE = 1000
+
+
+class Command(BaseCommand):
+    """
+    Пересобирает итоги списков покупок и проверяет их на расхождения
+    со списками покупок.
+    """
+    help = 'Пересобирает таблицу итогов списков покупок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только найти расхождения, не изменяя данные.',
+        )
+
+    def get_user_chunks(self):
+        user_ids = sorted(
+            set(ShoppingCart.objects.values_list('user_id', flat=True))
+            | set(ShoppingCartTotal.objects.values_list('user_id', flat=True))
+        )
+        for start in range(0, len(user_ids), USERS_CHUNK_SIZE):
+            yield user_ids[start:start + USERS_CHUNK_SIZE]
+
+    def find_drift(self, user_ids):
+        """Пары (пользователь, ингредиент), итоги которых разошлись."""
+        expected = {
+            (row['user_id'], row['ingredient_id']): row['total']
+            for row in ShoppingCartTotal.objects.calculate(user_ids)
+        }
+        actual = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount
+            in ShoppingCartTotal.objects.filter(
+                user_id__in=user_ids
+            ).values_list('user_id', 'ingredient_id', 'amount')
+        }
+        return {
+            key for key in expected.keys() | actual.keys()
+            if expected.get(key) != actual.get(key)
+        }
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            ShoppingCartTotal.objects.rebuild()
+            self.stdout.write(self.style.SUCCESS(
+                'Итоги списков покупок пересобраны.'
+            ))
+            return
+        drift = set()
+        for user_ids in self.get_user_chunks():
+            drift |= self.find_drift(user_ids)
+        if drift:
+            users = len({user_id for user_id, _ in drift})
+            raise CommandError(
+                f'Расхождений: {len(drift)} у {users} пользователей. '
+                'Запустите команду без --check.'
+            )
+        self.stdout.write(self.style.SUCCESS('Расхождений нет.'))
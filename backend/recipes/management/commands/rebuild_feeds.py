@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import FeedItem
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    """
+    Пересобирает ленты подписок. Нужна после загрузки данных
+    и после изменения `FEED_FANOUT_LIMIT` или пересчёта счётчиков
+    подписчиков.
+    """
+    help = 'Пересобирает ленты подписок пользователей'
+
+    def handle(self, *args, **options):
+        FeedItem.objects.rebuild(BATCH_SIZE)
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты пересобраны: {FeedItem.objects.count()} записей.'
+        ))
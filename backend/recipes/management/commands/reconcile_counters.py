@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.counters import find_counter_drift, reconcile_counter
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Follow, User
+
+# Счётчик и строки, которые он считает: (модель, поле счётчика,
+# связанная модель, поле связанной модели со ссылкой на объект).
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'author'),
+)
+
+
+class Command(BaseCommand):
+    """
+    Сверяет денормализованные счётчики с настоящим количеством
+    связанных объектов и исправляет расхождения.
+    """
+    help = 'Пересчитывает счётчики избранного, покупок, рецептов и подписчиков'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только найти расхождения, не изменяя данные.',
+        )
+
+    def handle(self, *args, **options):
+        total_drift = 0
+        for model, counter, related_model, field in COUNTERS:
+            drift = find_counter_drift(
+                model, counter, related_model, field,
+            ).count()
+            total_drift += drift
+            self.stdout.write(
+                f'{model.__name__}.{counter}: расхождений {drift}'
+            )
+            if drift and not options['check']:
+                with transaction.atomic():
+                    reconcile_counter(model, counter, related_model, field)
+        if options['check'] and total_drift:
+            raise CommandError(
+                f'Расхождений: {total_drift}. Запустите команду без --check.'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            'Счётчики пересчитаны.' if total_drift else 'Расхождений нет.'
+        ))
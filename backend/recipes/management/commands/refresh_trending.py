@@ -0,0 +1,43 @@
+from time import monotonic
+
+from django.core.management.base import BaseCommand
+
+from core.cache import bump_version, is_shared
+from recipes.indexes import RECIPES_VERSION_KEY
+from recipes.models import TrendingRefresh
+
+
+class Command(BaseCommand):
+    """
+    Обновляет рейтинг для сортировки `?ordering=trending`.
+    Запускается периодически, например из cron. Рейтинг читается
+    из БД, а закэшированные ответы анонимным пользователям
+    сбрасываются через общий кэш. С кэшем в памяти процесса они
+    обновятся не позже чем через `RESPONSE_CACHE_TIMEOUT` секунд.
+    """
+    help = 'Обновляет рейтинг набирающих популярность рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help=(
+                'Пересчитать рейтинг заново по всему окну, '
+                'учитывая удаления из избранного.'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        started = monotonic()
+        count = TrendingRefresh.objects.refresh(full=options['full'])
+        # Рейтинг не входит в индексы рецептов: их перестраивать не нужно.
+        bump_version(RECIPES_VERSION_KEY, ())
+        if not is_shared():
+            self.stdout.write(self.style.WARNING(
+                'Кэш не общий: ответы анонимным пользователям '
+                'обновятся по истечении RESPONSE_CACHE_TIMEOUT.'
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f'Рецептов в рейтинге: {count} '
+            f'за {monotonic() - started:.2f} с.'
+        ))
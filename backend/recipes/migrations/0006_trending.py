@@ -0,0 +1,59 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:02
+
+from django.db import migrations, models
+import datetime
+
+import django.db.models.deletion
+
+
+# Время добавления существующих строк избранного неизвестно. Дата
+# задолго до окна рейтинга не даёт им попасть в `trending`.
+UNKNOWN_CREATED = datetime.datetime(2000, 1, 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeScore',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='recipes.Recipe', verbose_name='Рецепт')),
+                ('score', models.FloatField(verbose_name='Рейтинг')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг рецепта',
+                'verbose_name_plural': 'Рейтинги рецептов',
+                'ordering': ('-score',),
+            },
+        ),
+        migrations.CreateModel(
+            name='TrendingRefresh',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_favorite_id', models.IntegerField(default=0, verbose_name='Последнее учтённое добавление в избранное')),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True, verbose_name='Время пересчёта')),
+            ],
+            options={
+                'verbose_name': 'Пересчёт рейтинга',
+                'verbose_name_plural': 'Пересчёты рейтинга',
+            },
+        ),
+        migrations.AddField(
+            model_name='favorite',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=UNKNOWN_CREATED, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-pub_date'], name='recipe_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipescore',
+            index=models.Index(fields=['-score', 'recipe'], name='recipe_score_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 2.2.16 on 2026-10-18 06:10
+
+from django.db import migrations, models
+
+
+def copy_scores(apps, schema_editor):
+    """Переносит посчитанный рейтинг, чтобы не ждать `refresh_trending`."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeScore = apps.get_model('recipes', 'RecipeScore')
+    for recipe_id, score in RecipeScore.objects.values_list(
+        'recipe_id', 'score',
+    ).iterator():
+        Recipe.objects.filter(pk=recipe_id).update(trending_score=score)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_updated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False, verbose_name='Рейтинг'),
+        ),
+        migrations.RunPython(copy_scores, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-trending_score', '-pub_date'], name='recipe_trending_idx'),
+        ),
+        migrations.DeleteModel(
+            name='RecipeScore',
+        ),
+    ]
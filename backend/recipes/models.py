@@ -1,21 +1,42 @@
+from collections import defaultdict
+from datetime import timedelta
+from itertools import chain, islice
+from math import exp, log
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
+from django.db import IntegrityError, transaction
 from django.db.models import (
     CASCADE,
+    Case,
     CharField,
     DateTimeField,
+    F,
+    FloatField,
     ForeignKey,
     ImageField,
+    Index,
+    IntegerField,
+    Manager,
     ManyToManyField,
+    Max,
     Model,
+    Q,
+    PositiveIntegerField,
     PositiveSmallIntegerField,
     SlugField,
+    Sum,
     TextField,
     UniqueConstraint,
+    Value,
+    When,
 )
+from django.utils import timezone
 
 from core.enums import Limits
 from recipes.validators import hex_color_validator
-from users.models import User
+from users.models import Follow, User
 
 
 class Tag(Model):
@@ -94,6 +115,16 @@ class Recipe(Model):
         verbose_name='Картинка блюда',
         upload_to='recipe_images/',
     )
+    image_thumbnail = ImageField(
+        verbose_name='Миниатюра картинки',
+        upload_to='recipe_images/resized/',
+        blank=True,
+    )
+    image_card = ImageField(
+        verbose_name='Картинка для карточки',
+        upload_to='recipe_images/resized/',
+        blank=True,
+    )
     name = CharField(
         verbose_name='Название',
         max_length=Limits.MAX_LEN_NAME.value,
@@ -119,11 +150,46 @@ class Recipe(Model):
         auto_now_add=True,
         db_index=True,
     )
+    updated = DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+        db_index=True,
+    )
+    favorites_count = PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False,
+    )
+    carts_count = PositiveIntegerField(
+        verbose_name='В списках покупок',
+        default=0,
+        editable=False,
+    )
+    trending_score = FloatField(
+        verbose_name='Рейтинг',
+        default=0,
+        editable=False,
+    )
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False,
+    )
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            Index(
+                fields=['-favorites_count', '-pub_date'],
+                name='recipe_popular_idx',
+            ),
+            Index(
+                fields=['-trending_score', '-pub_date'],
+                name='recipe_trending_idx',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.name}. Автор: {self.author.username}'
@@ -184,6 +250,11 @@ class Favorite(Model):
         verbose_name='Автор списка избранного',
         on_delete=CASCADE,
     )
+    created = DateTimeField(
+        verbose_name='Дата добавления',
+        auto_now_add=True,
+        db_index=True,
+    )
 
     class Meta:
         verbose_name = 'Избранный рецепт'
@@ -226,3 +297,481 @@ class ShoppingCart(Model):
 
     def __str__(self):
         return f'Рецепт {self.recipe} в списке покупок у {self.user.username}'
+
+
+# Сколько строк итогов сдвигается одним UPDATE.
+CART_TOTALS_CHUNK_SIZE = 500
+
+
+class ShoppingCartTotalManager(Manager):
+    """
+    Поддерживает итоги списков покупок в актуальном состоянии,
+    прибавляя и вычитая количества ингредиентов рецепта.
+    """
+    def get_recipe_amounts(self, recipe):
+        """Количество каждого ингредиента рецепта: {id ингредиента: n}."""
+        return dict(IngredientAmount.objects.filter(
+            recipe=recipe
+        ).values_list('ingredient_id', 'amount'))
+
+    def apply(self, user_ids, deltas):
+        """
+        Прибавляет изменения `deltas` к итогам пользователей.
+        Существующие строки блокируются и сдвигаются UPDATE, новые
+        вставляются. Если строку одновременно вставила другая
+        транзакция, вставка откатывается до точки сохранения
+        и изменение прибавляется к уже вставленной строке.
+        """
+        deltas = {
+            ingredient_id: delta
+            for ingredient_id, delta in deltas.items() if delta
+        }
+        if not deltas:
+            return
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        amount = F('amount') + Case(
+            *(
+                When(ingredient_id=ingredient_id, then=Value(delta))
+                for ingredient_id, delta in deltas.items()
+            ),
+            output_field=IntegerField(),
+        )
+        pending = {
+            (user_id, ingredient_id)
+            for user_id in user_ids for ingredient_id in deltas
+        }
+        with transaction.atomic():
+            while pending:
+                existing = {
+                    (user_id, ingredient_id): pk
+                    for pk, user_id, ingredient_id in self.filter(
+                        user_id__in={user_id for user_id, _ in pending},
+                        ingredient_id__in=deltas,
+                    ).select_for_update().values_list(
+                        'pk', 'user_id', 'ingredient_id',
+                    )
+                    if (user_id, ingredient_id) in pending
+                }
+                pks = list(existing.values())
+                for start in range(0, len(pks), CART_TOTALS_CHUNK_SIZE):
+                    self.filter(
+                        pk__in=pks[start:start + CART_TOTALS_CHUNK_SIZE]
+                    ).update(amount=amount)
+                pending -= existing.keys()
+                new_totals = [
+                    ShoppingCartTotal(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        amount=deltas[ingredient_id],
+                    )
+                    for user_id, ingredient_id in pending
+                    if deltas[ingredient_id] > 0
+                ]
+                if not new_totals:
+                    break
+                try:
+                    with transaction.atomic():
+                        self.bulk_create(new_totals)
+                except IntegrityError:
+                    continue
+                break
+            self.filter(user_id__in=user_ids, amount__lte=0).delete()
+
+    def get_recipes_amounts(self, recipes):
+        """Суммарное количество ингредиентов нескольких рецептов."""
+        return dict(IngredientAmount.objects.filter(
+            recipe__in=recipes
+        ).values('ingredient_id').annotate(
+            total=Sum('amount')
+        ).values_list('ingredient_id', 'total').order_by())
+
+    def add_recipe(self, user, recipe):
+        """Рецепт добавлен в список покупок пользователя."""
+        self.add_recipes(user, [recipe])
+
+    def remove_recipe(self, user, recipe):
+        """Рецепт убран из списка покупок пользователя."""
+        self.remove_recipes(user, [recipe])
+
+    def add_recipes(self, user, recipes):
+        """Рецепты добавлены в список покупок пользователя."""
+        self.apply([user.id], self.get_recipes_amounts(recipes))
+
+    def remove_recipes(self, user, recipes):
+        """Рецепты убраны из списка покупок пользователя."""
+        self.apply([user.id], {
+            ingredient_id: -amount
+            for ingredient_id, amount
+            in self.get_recipes_amounts(recipes).items()
+        })
+
+    def change_recipe(self, recipe, old_amounts, new_amounts=None):
+        """
+        Ингредиенты рецепта изменились или рецепт удаляется
+        (`new_amounts` пуст): итоги всех, у кого он в списке покупок,
+        сдвигаются на разницу количеств.
+        """
+        new_amounts = new_amounts or {}
+        deltas = {
+            ingredient_id: (
+                new_amounts.get(ingredient_id, 0)
+                - old_amounts.get(ingredient_id, 0)
+            )
+            for ingredient_id in old_amounts.keys() | new_amounts.keys()
+        }
+        self.apply(
+            ShoppingCart.objects.filter(
+                recipe=recipe
+            ).values_list('user_id', flat=True),
+            deltas,
+        )
+
+    def calculate(self, users=None):
+        """Итоги, посчитанные заново по спискам покупок."""
+        carts = ShoppingCart.objects.all()
+        if users is not None:
+            carts = carts.filter(user__in=users)
+        return carts.values(
+            'user_id', ingredient_id=F('recipe__ingredient__ingredient'),
+        ).annotate(
+            total=Sum('recipe__ingredient__amount'),
+        ).filter(ingredient_id__isnull=False).order_by()
+
+    def rebuild(self, users=None, batch_size=1000):
+        """Пересобирает итоги с нуля."""
+        totals = self.all()
+        if users is not None:
+            totals = totals.filter(user__in=users)
+        with transaction.atomic():
+            totals.delete()
+            rows = self.calculate(users).iterator()
+            while True:
+                batch = [
+                    ShoppingCartTotal(
+                        user_id=row['user_id'],
+                        ingredient_id=row['ingredient_id'],
+                        amount=row['total'],
+                    )
+                    for _, row in zip(range(batch_size), rows)
+                ]
+                if not batch:
+                    break
+                self.bulk_create(batch)
+
+
+class ShoppingCartTotal(Model):
+    """
+    Суммарное количество ингредиента в списке покупок пользователя.
+    Денормализованная таблица для выгрузки списка одним запросом.
+    """
+    user = ForeignKey(
+        User,
+        related_name='cart_totals',
+        verbose_name='Владелец списка покупок',
+        on_delete=CASCADE,
+    )
+    ingredient = ForeignKey(
+        Ingredient,
+        related_name='cart_totals',
+        verbose_name='Ингридиент',
+        on_delete=CASCADE,
+    )
+    amount = IntegerField(verbose_name='Количество ингридиента')
+
+    objects = ShoppingCartTotalManager()
+
+    class Meta:
+        verbose_name = 'Итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_cart_total_ingredient',
+            ),
+        ]
+
+    def __str__(self):
+        return (
+            f'{self.ingredient.name}: {self.amount} '
+            f'{self.ingredient.measurement_unit} у {self.user.username}'
+        )
+
+
+class TrendingRefreshManager(Manager):
+    """
+    Пересчитывает рейтинг `trending`: каждое добавление в избранное
+    за последние `TRENDING_WINDOW_DAYS` дней весит exp(-λ·возраст),
+    вес убывает вдвое за `TRENDING_HALF_LIFE_HOURS` часов.
+    Рейтинг хранится в `Recipe.trending_score`, у рецептов без
+    недавних добавлений он равен нулю.
+    """
+    def get_decay_rate(self):
+        return log(2) / (settings.TRENDING_HALF_LIFE_HOURS * 3600)
+
+    def get_min_score(self):
+        """Вес одного добавления, которому исполнилось `окно` дней."""
+        return exp(
+            -self.get_decay_rate() * settings.TRENDING_WINDOW_DAYS * 86400
+        )
+
+    def collect(self, favorites, now):
+        """Сумма весов добавлений в избранное по рецептам."""
+        rate = self.get_decay_rate()
+        scores = defaultdict(float)
+        for recipe_id, created in favorites.values_list(
+            'recipe_id', 'created',
+        ).order_by().iterator():
+            age = max((now - created).total_seconds(), 0)
+            scores[recipe_id] += exp(-rate * age)
+        return scores
+
+    def refresh(self, full=False, now=None):
+        """
+        Состаривает сохранённый рейтинг на время с прошлого запуска
+        и добавляет веса новых строк `Favorite`. Удаления из
+        избранного учитываются только при полном пересчёте (`full`).
+        Возвращает число рецептов в рейтинге.
+        """
+        now = now or timezone.now()
+        cutoff = now - timedelta(days=settings.TRENDING_WINDOW_DAYS)
+        scored = Recipe.objects.filter(trending_score__gt=0)
+        with transaction.atomic():
+            state, _ = self.select_for_update().get_or_create(
+                pk=TrendingRefresh.SINGLETON_ID,
+            )
+            last_favorite_id = Favorite.objects.aggregate(
+                last=Max('id')
+            )['last'] or 0
+            favorites = Favorite.objects.filter(
+                id__lte=last_favorite_id, created__gte=cutoff,
+            )
+            if full or state.refreshed_at is None:
+                scored.update(trending_score=0)
+            else:
+                elapsed = (now - state.refreshed_at).total_seconds()
+                scored.update(trending_score=F('trending_score') * exp(
+                    -self.get_decay_rate() * max(elapsed, 0)
+                ))
+                favorites = favorites.filter(
+                    id__gt=state.last_favorite_id
+                )
+            self.add_scores(self.collect(favorites, now))
+            scored.filter(
+                trending_score__lt=self.get_min_score(),
+            ).update(trending_score=0)
+            state.last_favorite_id = last_favorite_id
+            state.refreshed_at = now
+            state.save()
+        return scored.count()
+
+    def add_scores(self, scores):
+        """Прибавляет веса к рейтингу рецептов."""
+        recipes = Recipe.objects.only('trending_score').in_bulk(list(scores))
+        for recipe_id, recipe in recipes.items():
+            recipe.trending_score += scores[recipe_id]
+        Recipe.objects.bulk_update(recipes.values(), ['trending_score'])
+
+
+class TrendingRefresh(Model):
+    """
+    Состояние пересчёта рейтинга: до какой строки `Favorite`
+    и на какой момент он посчитан. В таблице одна строка.
+    """
+    SINGLETON_ID = 1
+
+    last_favorite_id = IntegerField(
+        verbose_name='Последнее учтённое добавление в избранное',
+        default=0,
+    )
+    refreshed_at = DateTimeField(
+        verbose_name='Время пересчёта',
+        null=True,
+        blank=True,
+    )
+
+    objects = TrendingRefreshManager()
+
+    class Meta:
+        verbose_name = 'Пересчёт рейтинга'
+        verbose_name_plural = 'Пересчёты рейтинга'
+
+    def __str__(self):
+        return f'Рейтинг посчитан на {self.refreshed_at}'
+
+
+class FeedItemManager(Manager):
+    """
+    Ленты рецептов подписок. Рецепты обычных авторов раскладываются
+    по лентам подписчиков при публикации, рецепты авторов, у которых
+    больше `FEED_FANOUT_LIMIT` подписчиков, добавляются при чтении.
+    """
+    def get_fanout_authors(self):
+        return User.objects.filter(
+            followers_count__lte=settings.FEED_FANOUT_LIMIT
+        )
+
+    def fan_out(self, recipe_id):
+        """Кладёт новый рецепт в ленты подписчиков автора."""
+        self.create_items(
+            Recipe.objects.filter(
+                pk=recipe_id, author__in=self.get_fanout_authors(),
+            ),
+        )
+
+    def fill_author(self, author_id, batch_size=1000):
+        """
+        Добавляет в ленты подписчиков все рецепты автора. Нужна, когда
+        подписчиков у автора стало не больше `FEED_FANOUT_LIMIT`:
+        рецепты, опубликованные выше порога, в лентах отсутствуют.
+        """
+        self.create_items(
+            Recipe.objects.filter(
+                author_id=author_id, author__in=self.get_fanout_authors(),
+            ),
+            batch_size,
+        )
+
+    def create_items(self, recipes, batch_size=1000):
+        """
+        Записи лент для рецептов `recipes` у всех подписчиков их
+        авторов, пачками по `batch_size`. Уже существующие пропускаются.
+        """
+        rows = recipes.filter(author__following__isnull=False).values_list(
+            'author__following__user_id', 'id', 'author_id', 'pub_date',
+        ).order_by().iterator(chunk_size=batch_size)
+        items = (
+            FeedItem(
+                user_id=user_id,
+                recipe_id=recipe_id,
+                author_id=author_id,
+                pub_date=pub_date,
+            )
+            for user_id, recipe_id, author_id, pub_date in rows
+        )
+        while True:
+            batch = list(islice(items, batch_size))
+            if not batch:
+                break
+            self.bulk_create(batch, ignore_conflicts=True)
+
+    def backfill(self, user, author):
+        """Добавляет в ленту рецепты автора после подписки на него."""
+        if not self.get_fanout_authors().filter(pk=author.pk).exists():
+            return
+        self.bulk_create(
+            (
+                FeedItem(
+                    user_id=user.pk,
+                    recipe_id=recipe_id,
+                    author_id=author.pk,
+                    pub_date=pub_date,
+                )
+                for recipe_id, pub_date in Recipe.objects.filter(
+                    author=author
+                ).values_list('id', 'pub_date').iterator()
+            ),
+            ignore_conflicts=True,
+        )
+
+    def prune(self, user, author):
+        """Убирает рецепты автора из ленты после отписки."""
+        self.filter(user=user, author=author).delete()
+
+    def get_page(self, user, limit, before=None):
+        """
+        До `limit` пар (id рецепта, дата публикации) из ленты,
+        начиная после позиции `before` = (дата, id рецепта).
+        Лента и рецепты популярных авторов читаются по индексам
+        в порядке (-pub_date, -id) и сливаются.
+        """
+        items = self.filter(user=user)
+        recipes = Recipe.objects.filter(
+            author__in=Follow.objects.filter(
+                user=user,
+                author__followers_count__gt=settings.FEED_FANOUT_LIMIT,
+            ).values('author_id'),
+        )
+        if before is not None:
+            pub_date, recipe_id = before
+            items = items.filter(
+                Q(pub_date__lt=pub_date)
+                | Q(pub_date=pub_date, recipe_id__lt=recipe_id)
+            )
+            recipes = recipes.filter(
+                Q(pub_date__lt=pub_date)
+                | Q(pub_date=pub_date, id__lt=recipe_id)
+            )
+        merged = {}
+        for recipe_id, pub_date in chain(
+            items.order_by('-pub_date', '-recipe_id').values_list(
+                'recipe_id', 'pub_date',
+            )[:limit],
+            recipes.order_by('-pub_date', '-id').values_list(
+                'id', 'pub_date',
+            )[:limit],
+        ):
+            merged[recipe_id] = pub_date
+        return sorted(
+            ((recipe_id, pub_date) for recipe_id, pub_date in merged.items()),
+            key=lambda item: (item[1], item[0]),
+            reverse=True,
+        )[:limit]
+
+    def rebuild(self, batch_size=1000):
+        """Пересобирает все ленты по подпискам одним проходом."""
+        with transaction.atomic():
+            self.all().delete()
+            self.create_items(
+                Recipe.objects.filter(author__in=self.get_fanout_authors()),
+                batch_size,
+            )
+
+
+class FeedItem(Model):
+    """
+    Рецепт в ленте подписок пользователя. Дата публикации
+    копируется из рецепта, чтобы лента читалась по одному индексу.
+    """
+    user = ForeignKey(
+        User,
+        related_name='feed_items',
+        verbose_name='Владелец ленты',
+        on_delete=CASCADE,
+    )
+    recipe = ForeignKey(
+        Recipe,
+        related_name='feed_items',
+        verbose_name='Рецепт',
+        on_delete=CASCADE,
+    )
+    author = ForeignKey(
+        User,
+        related_name='+',
+        verbose_name='Автор рецепта',
+        on_delete=CASCADE,
+    )
+    pub_date = DateTimeField(verbose_name='Дата публикации')
+
+    objects = FeedItemManager()
+
+    class Meta:
+        verbose_name = 'Рецепт в ленте'
+        verbose_name_plural = 'Рецепты в лентах'
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_item',
+            ),
+        ]
+        indexes = [
+            Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_item_page_idx',
+            ),
+            Index(fields=['user', 'author'], name='feed_item_author_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id} в ленте {self.user_id}'
@@ -0,0 +1,86 @@
+"""
+Полнотекстовый поиск рецептов. В Postgres используется столбец
+`search_vector` с GIN-индексом, в остальных базах - индекс
+в памяти `recipe_search_index`.
+"""
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection, transaction
+from django.db.models import F
+
+from recipes.indexes import recipe_search_index
+
+SEARCH_CONFIG = 'russian'
+RANKING_ATTRIBUTE = '_search_ranking'
+SEARCH_VECTOR_SQL = f"""
+    UPDATE recipes_recipe AS recipe SET search_vector =
+        setweight(to_tsvector('{SEARCH_CONFIG}', recipe.name), 'A')
+        || setweight(to_tsvector('{SEARCH_CONFIG}', coalesce((
+            SELECT string_agg(ingredient.name, ' ')
+            FROM recipes_ingredientamount AS amount
+            JOIN recipes_ingredient AS ingredient
+                ON ingredient.id = amount.ingredient_id
+            WHERE amount.recipe_id = recipe.id
+        ), '')), 'B')
+        || setweight(to_tsvector('{SEARCH_CONFIG}', recipe.text), 'C')
+"""
+
+
+def is_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def update_search_vectors(recipe_ids):
+    """Пересчитывает `search_vector` рецептов одним UPDATE."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            SEARCH_VECTOR_SQL + ' WHERE recipe.id = ANY(%s)',
+            [list(recipe_ids)],
+        )
+
+
+def schedule_search_update(recipe_ids):
+    """
+    Обновляет поисковый вектор после фиксации транзакции, когда
+    рецепт и его ингредиенты уже записаны. Индексу в памяти
+    достаточно смены версии рецептов.
+    """
+    if not is_postgres():
+        return
+    recipe_ids = list(recipe_ids)
+    if recipe_ids:
+        transaction.on_commit(lambda: update_search_vectors(recipe_ids))
+
+
+def search_recipes(queryset, query, request=None):
+    """
+    Рецепты, подходящие под запрос, по убыванию релевантности.
+    Без Postgres порядок из индекса в памяти сохраняется в `request`:
+    страница выбирается по нему функцией `paginate_ranked`.
+    """
+    if is_postgres():
+        search_query = SearchQuery(query, config=SEARCH_CONFIG)
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=SearchRank(F('search_vector'), search_query),
+        ).order_by('-rank', '-pub_date')
+    recipe_ids = recipe_search_index.search(query)
+    if request is not None:
+        setattr(request, RANKING_ATTRIBUTE, recipe_ids)
+    return queryset.filter(pk__in=recipe_ids)
+
+
+def get_ranking(request):
+    """Порядок рецептов из поиска без Postgres или None."""
+    return getattr(request, RANKING_ATTRIBUTE, None)
+
+
+def paginate_ranked(queryset, ranking, paginate):
+    """
+    Выбирает страницу из id в порядке `ranking`, оставшихся после
+    фильтров, и загружает только её рецепты.
+    """
+    matched = set(queryset.order_by().values_list('pk', flat=True))
+    page = paginate([pk for pk in ranking if pk in matched])
+    if page is None:
+        return None
+    recipes = queryset.in_bulk(page)
+    return [recipes[pk] for pk in page if pk in recipes]
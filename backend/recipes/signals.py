@@ -0,0 +1,116 @@
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+
+from core.cache import bump_version, bump_version_on_commit
+from recipes.feeds import schedule_fan_out
+from recipes.images import schedule_delete_resized, schedule_resize
+from recipes.indexes import (
+    INGREDIENTS_VERSION_KEY,
+    RECIPES_VERSION_KEY,
+    TAGS_VERSION_KEY,
+)
+from recipes.models import (
+    Ingredient,
+    IngredientAmount,
+    Recipe,
+    ShoppingCartTotal,
+    Tag,
+)
+from recipes.search import schedule_search_update
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(**kwargs):
+    """Сбрасывает индекс ингредиентов после изменений в админке."""
+    bump_version(INGREDIENTS_VERSION_KEY)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tag_registry(**kwargs):
+    """Сбрасывает реестр тегов после изменений в админке."""
+    bump_version_on_commit(TAGS_VERSION_KEY)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_recipes(**kwargs):
+    """Сбрасывает кэш ответов с рецептами после изменения их данных."""
+    bump_version_on_commit(RECIPES_VERSION_KEY)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(**kwargs):
+    """Теги не входят в индексы рецептов, их перестраивать не нужно."""
+    bump_version_on_commit(RECIPES_VERSION_KEY, ())
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe(instance, **kwargs):
+    """Индексы рецептов обновляются только для изменённого рецепта."""
+    bump_version_on_commit(RECIPES_VERSION_KEY, (instance.pk, ))
+
+
+@receiver((post_save, post_delete), sender=IngredientAmount)
+def invalidate_recipe_ingredients(instance, **kwargs):
+    bump_version_on_commit(RECIPES_VERSION_KEY, (instance.recipe_id, ))
+
+
+@receiver(pre_delete, sender=Recipe)
+def subtract_cart_totals(instance, **kwargs):
+    """
+    Вычитает рецепт из итогов списков покупок, пока его ингредиенты
+    и строки списков ещё не удалены каскадом: при удалении через API,
+    в админке и вместе с автором.
+    """
+    ShoppingCartTotal.objects.change_recipe(
+        instance, ShoppingCartTotal.objects.get_recipe_amounts(instance),
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def resize_recipe_image(instance, **kwargs):
+    """Готовит уменьшенные копии нового изображения рецепта."""
+    schedule_resize(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_resized_images(instance, **kwargs):
+    """Уменьшенные копии удалённого рецепта больше не нужны."""
+    schedule_delete_resized(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search(instance, **kwargs):
+    """Обновляет поисковый вектор сохранённого рецепта."""
+    schedule_search_update([instance.pk])
+
+
+@receiver((post_save, post_delete), sender=IngredientAmount)
+def update_ingredient_amount_search(instance, **kwargs):
+    """Ингредиенты рецепта изменились в админке."""
+    schedule_search_update([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_search(instance, **kwargs):
+    """Переименованный ингредиент ищется во всех его рецептах."""
+    if kwargs.get('created'):
+        return
+    schedule_search_update(IngredientAmount.objects.filter(
+        ingredient=instance
+    ).values_list('recipe_id', flat=True).distinct())
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(instance, created, **kwargs):
+    """
+    Раскладывает новый рецепт по лентам подписчиков автора
+    в фоне, чтобы не задерживать ответ на публикацию.
+    """
+    if created:
+        schedule_fan_out(instance)
@@ -0,0 +1,106 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from recipes.models import (
+    Ingredient,
+    IngredientAmount,
+    Recipe,
+    ShoppingCart,
+    ShoppingCartTotal,
+)
+from users.models import User
+
+
+class CartTotalsTest(TestCase):
+    """Итоги списков покупок верны и после изменений не через API."""
+    def setUp(self):
+        resize = mock.patch('recipes.signals.schedule_resize')
+        resize.start()
+        self.addCleanup(resize.stop)
+        self.reader = self.create_user('reader')
+        self.authors = [
+            self.create_user(f'author{number}') for number in (0, 1)
+        ]
+        self.ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('картофель', 'соль')
+        ]
+        self.recipes = [
+            self.create_recipe(author, number)
+            for number, author in enumerate(self.authors)
+        ]
+        for recipe in self.recipes:
+            ShoppingCart.objects.create(user=self.reader, recipe=recipe)
+        ShoppingCartTotal.objects.rebuild()
+
+    def create_user(self, username, **extra):
+        return User.objects.create(
+            username=username, email=f'{username}@example.com',
+            first_name='Имя', last_name='Фамилия', **extra,
+        )
+
+    def create_recipe(self, author, number):
+        recipe = Recipe.objects.create(
+            author=author,
+            name=f'Рецепт {number}',
+            text='Описание',
+            cooking_time=10,
+            image='recipe_images/test.png',
+        )
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(recipe=recipe, ingredient=ingredient, amount=100)
+            for ingredient in self.ingredients
+        )
+        return recipe
+
+    def check_totals(self, expected):
+        totals = dict(ShoppingCartTotal.objects.filter(
+            user=self.reader
+        ).values_list('ingredient_id', 'amount'))
+        calculated = {
+            row['ingredient_id']: row['total']
+            for row in ShoppingCartTotal.objects.calculate([self.reader])
+        }
+        self.assertEqual(totals, calculated)
+        self.assertEqual(sorted(totals.values()), expected)
+
+    def test_recipe_and_author_deletes(self):
+        self.check_totals([200, 200])
+        self.recipes[0].delete()
+        self.check_totals([100, 100])
+        self.authors[1].delete()
+        self.check_totals([])
+
+    def test_admin_changes(self):
+        admin = self.create_user('admin', is_staff=True, is_superuser=True)
+        self.client.force_login(admin)
+        amount = IngredientAmount.objects.filter(
+            recipe=self.recipes[0], ingredient=self.ingredients[0],
+        ).get()
+        response = self.client.post(
+            f'/admin/recipes/ingredientamount/{amount.pk}/change/',
+            {
+                'recipe': self.recipes[0].pk,
+                'ingredient': self.ingredients[0].pk,
+                'amount': 300,
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.check_totals([200, 400])
+        cart = ShoppingCart.objects.get(recipe=self.recipes[1])
+        response = self.client.post(
+            f'/admin/recipes/shoppingcart/{cart.pk}/delete/', {'post': 'yes'},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.check_totals([100, 300])
+        response = self.client.post(
+            '/admin/recipes/ingredientamount/',
+            {
+                'action': 'delete_selected',
+                'post': 'yes',
+                '_selected_action': [amount.pk],
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.check_totals([100])
@@ -0,0 +1,86 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from core.counters import find_counter_drift, reconcile_counter
+from recipes.management.commands.reconcile_counters import COUNTERS
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Follow, User
+
+
+class CountersTest(TestCase):
+    """Счётчики не расходятся после изменений в админке и каскадов."""
+    def setUp(self):
+        resize = mock.patch('recipes.signals.schedule_resize')
+        resize.start()
+        self.addCleanup(resize.stop)
+        self.reader = self.create_user('reader')
+        self.authors = [
+            self.create_user(f'author{number}') for number in (0, 1)
+        ]
+        self.recipes = [
+            Recipe.objects.create(
+                author=author,
+                name=f'Рецепт {number}',
+                text='Описание',
+                cooking_time=10,
+                image='recipe_images/test.png',
+            )
+            for number, author in enumerate(self.authors)
+        ]
+        for recipe in self.recipes:
+            Favorite.objects.create(user=self.reader, recipe=recipe)
+            ShoppingCart.objects.create(user=self.reader, recipe=recipe)
+        Follow.objects.create(user=self.reader, author=self.authors[0])
+        for model, counter, related_model, field in COUNTERS:
+            reconcile_counter(model, counter, related_model, field)
+        admin = self.create_user('admin', is_staff=True, is_superuser=True)
+        self.client.force_login(admin)
+
+    def create_user(self, username, **extra):
+        return User.objects.create(
+            username=username, email=f'{username}@example.com',
+            first_name='Имя', last_name='Фамилия', **extra,
+        )
+
+    def check_counters(self):
+        for model, counter, related_model, field in COUNTERS:
+            with self.subTest(counter=counter):
+                self.assertFalse(find_counter_drift(
+                    model, counter, related_model, field,
+                ).exists())
+
+    def test_admin_changes(self):
+        follow = Follow.objects.get()
+        response = self.client.post(
+            f'/admin/users/follow/{follow.pk}/change/',
+            {'user': self.reader.pk, 'author': self.authors[1].pk},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.check_counters()
+        response = self.client.post(
+            '/admin/recipes/shoppingcart/',
+            {
+                'action': 'delete_selected',
+                'post': 'yes',
+                '_selected_action': list(
+                    ShoppingCart.objects.values_list('pk', flat=True)
+                ),
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.check_counters()
+        favorite = Favorite.objects.filter(recipe=self.recipes[0]).get()
+        response = self.client.post(
+            f'/admin/recipes/favorite/{favorite.pk}/delete/', {'post': 'yes'},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.check_counters()
+
+    def test_recipe_and_user_deletes(self):
+        self.recipes[0].delete()
+        self.check_counters()
+        self.reader.delete()
+        self.check_counters()
+        self.authors[1].delete()
+        self.check_counters()
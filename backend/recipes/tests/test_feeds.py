@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TransactionTestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import FeedItem, Recipe
+from users.models import Follow, User
+
+START = datetime(2024, 1, 1, 12)
+
+
+@override_settings(FEED_FANOUT_LIMIT=1)
+@mock.patch('recipes.feeds.executor', None)
+@mock.patch('recipes.signals.schedule_resize', mock.Mock())
+class FeedTest(TransactionTestCase):
+    """
+    Лента подписок при `FEED_FANOUT_LIMIT = 1`: рецепты автора с одним
+    подписчиком раскладываются по лентам, с двумя - читаются напрямую.
+    """
+    def setUp(self):
+        cache.clear()
+        self.readers = [
+            self.create_user(f'reader{number}') for number in range(2)
+        ]
+        self.author = self.create_user('author')
+        self.popular = self.create_user('popular')
+        for reader in self.readers:
+            self.follow(reader, self.popular)
+
+    def create_user(self, username):
+        return User.objects.create(
+            username=username, email=f'{username}@example.com',
+            first_name='Имя', last_name='Фамилия',
+        )
+
+    def follow(self, user, author):
+        Follow.objects.create(user=user, author=author)
+        User.objects.filter(pk=author.pk).update(
+            followers_count=Follow.objects.filter(author=author).count(),
+        )
+
+    def create_recipe(self, author, hours):
+        recipe = Recipe.objects.create(
+            author=author,
+            name=f'Рецепт {author.username} {hours}',
+            text='Описание',
+            cooking_time=10,
+            image='recipe_images/test.png',
+        )
+        # `pub_date` заполняется автоматически, порядок задаётся явно.
+        pub_date = START + timedelta(hours=hours)
+        Recipe.objects.filter(pk=recipe.pk).update(pub_date=pub_date)
+        FeedItem.objects.filter(recipe=recipe).update(pub_date=pub_date)
+        return recipe
+
+    def get_client(self, user):
+        token, _ = Token.objects.get_or_create(user=user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+    def get_feed(self, user, params=None, url='/api/recipes/feed/'):
+        response = self.get_client(user).get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_fan_out_after_commit(self):
+        self.follow(self.readers[0], self.author)
+        with transaction.atomic():
+            recipe = self.create_recipe(self.author, 0)
+            self.assertFalse(FeedItem.objects.exists())
+        self.assertEqual(
+            list(FeedItem.objects.values_list('user_id', 'recipe_id')),
+            [(self.readers[0].pk, recipe.pk)],
+        )
+
+    def test_merges_popular_authors_by_pub_date(self):
+        self.follow(self.readers[0], self.author)
+        recipes = [
+            self.create_recipe(author, hours)
+            for hours, author in enumerate(
+                (self.author, self.popular, self.author, self.popular)
+            )
+        ]
+        self.assertEqual(FeedItem.objects.count(), 2)
+        data = self.get_feed(self.readers[0], {'limit': 3})
+        self.assertEqual(
+            [recipe['id'] for recipe in data['results']],
+            [recipe.pk for recipe in recipes[:0:-1]],
+        )
+        data = self.get_feed(self.readers[0], url=data['next'])
+        self.assertEqual(
+            [recipe['id'] for recipe in data['results']], [recipes[0].pk],
+        )
+        self.assertIsNone(data['next'])
+
+    def test_fills_feeds_when_author_drops_to_limit(self):
+        recipe = self.create_recipe(self.popular, 0)
+        self.assertFalse(FeedItem.objects.exists())
+        response = self.get_client(self.readers[1]).delete(
+            f'/api/users/{self.popular.pk}/subscribe/',
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(
+            list(FeedItem.objects.values_list('user_id', 'recipe_id')),
+            [(self.readers[0].pk, recipe.pk)],
+        )
+        self.assertEqual(
+            [item['id'] for item in self.get_feed(self.readers[0])['results']],
+            [recipe.pk],
+        )
@@ -0,0 +1,60 @@
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TransactionTestCase, override_settings
+from PIL import Image
+
+from recipes.models import Recipe
+from users.models import User
+
+
+def create_image(name):
+    buffer = BytesIO()
+    Image.new('RGB', (1000, 800), 'red').save(buffer, 'PNG')
+    return ContentFile(buffer.getvalue(), name=name)
+
+
+@mock.patch('recipes.images.executor', None)
+class ResizedImagesTest(TransactionTestCase):
+    """Уменьшенные копии не остаются в хранилище после замены и удаления."""
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.author = User.objects.create(
+            username='author', email='author@example.com',
+            first_name='Автор', last_name='Автор',
+        )
+
+    def get_resized(self, recipe):
+        recipe.refresh_from_db()
+        names = [
+            getattr(recipe, field).name
+            for field in settings.RECIPE_IMAGE_SIZES
+        ]
+        self.assertTrue(all(names))
+        self.assertTrue(all(default_storage.exists(name) for name in names))
+        return names
+
+    def test_replace_and_delete(self):
+        recipe = Recipe.objects.create(
+            author=self.author,
+            name='Рецепт',
+            text='Описание',
+            cooking_time=10,
+            image=create_image('first.png'),
+        )
+        first = self.get_resized(recipe)
+        recipe.image = create_image('second.png')
+        recipe.save()
+        second = self.get_resized(recipe)
+        self.assertFalse(set(first) & set(second))
+        self.assertFalse(any(default_storage.exists(name) for name in first))
+        recipe.delete()
+        self.assertFalse(any(default_storage.exists(name) for name in second))
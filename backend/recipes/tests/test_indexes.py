@@ -0,0 +1,145 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from core.cache import bump_version
+from recipes.indexes import (
+    RECIPES_VERSION_KEY,
+    IngredientIndex,
+    RecipeIngredientIndex,
+)
+from recipes.models import Ingredient, IngredientAmount, Recipe
+from users.models import User
+
+
+class IngredientIndexTest(TestCase):
+    """Ингредиенты, добавленные другим процессом, попадают в индекс."""
+    def setUp(self):
+        cache.clear()
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        self.index = IngredientIndex()
+
+    def import_ingredient(self):
+        """Вставка без сигналов, как в `import_ingrs`."""
+        Ingredient.objects.bulk_create(
+            [Ingredient(name='сахар', measurement_unit='г')],
+        )
+
+    def test_marker_is_checked_after_interval(self):
+        with override_settings(INDEX_CHECK_INTERVAL=0):
+            self.assertEqual(len(self.index.all()), 1)
+            self.import_ingredient()
+            self.assertEqual(len(self.index.all()), 2)
+
+    def test_marker_is_not_checked_within_interval(self):
+        with override_settings(INDEX_CHECK_INTERVAL=3600):
+            self.assertEqual(len(self.index.all()), 1)
+            self.import_ingredient()
+            with self.assertNumQueries(0):
+                self.assertEqual(len(self.index.all()), 1)
+
+
+class RecipeIngredientIndexTest(TestCase):
+    """Изменённые рецепты обновляются в индексе без перестройки."""
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(
+            username='author', email='author@example.com',
+            first_name='Автор', last_name='Автор',
+        )
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {number}', measurement_unit='г',
+            )
+            for number in range(3)
+        ]
+        cls.recipes = [
+            Recipe.objects.create(
+                author=author,
+                name=f'Рецепт {number}',
+                text='Описание',
+                cooking_time=10,
+                image='recipe_images/test.png',
+            )
+            for number in range(2)
+        ]
+        for recipe, ingredients in zip(cls.recipes, (
+            cls.ingredients[:2], cls.ingredients[1:],
+        )):
+            IngredientAmount.objects.bulk_create(
+                IngredientAmount(
+                    recipe=recipe, ingredient=ingredient, amount=1,
+                )
+                for ingredient in ingredients
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.index = RecipeIngredientIndex()
+        self.index.warm()
+
+    def match(self, *ingredients, **kwargs):
+        return self.index.match(
+            [ingredient.pk for ingredient in ingredients], **kwargs,
+        )
+
+    def test_match_order_and_limit(self):
+        first, second = self.recipes
+        self.assertEqual(
+            self.match(*self.ingredients[:2]),
+            [(first.pk, 1.0), (second.pk, 0.5)],
+        )
+        self.assertEqual(
+            self.match(*self.ingredients[:2], limit=1), [(first.pk, 1.0)],
+        )
+        self.assertEqual(
+            self.match(self.ingredients[0], min_coverage=0.6), [],
+        )
+
+    def test_changed_recipe_is_updated_in_place(self):
+        first, second = self.recipes
+        IngredientAmount.objects.filter(recipe=first).delete()
+        IngredientAmount.objects.create(
+            recipe=first, ingredient=self.ingredients[2], amount=1,
+        )
+        bump_version(RECIPES_VERSION_KEY, [first.pk])
+        with mock.patch.object(
+            self.index, '_build', side_effect=AssertionError,
+        ), self.assertNumQueries(1):
+            self.assertEqual(
+                self.match(self.ingredients[2]),
+                [(first.pk, 1.0), (second.pk, 0.5)],
+            )
+        self.assertEqual(self.match(self.ingredients[0]), [])
+        Recipe.objects.filter(pk=second.pk).delete()
+        bump_version(RECIPES_VERSION_KEY, [second.pk])
+        self.assertEqual(
+            self.match(self.ingredients[2]), [(first.pk, 1.0)],
+        )
+
+    @override_settings(INDEX_CHECK_INTERVAL=0)
+    def test_other_process_writes_are_found_by_marker(self):
+        """Версия не сменилась, как при записи из другого процесса."""
+        first, second = self.recipes
+        recipe = Recipe.objects.create(
+            author=first.author,
+            name='Новый рецепт',
+            text='Описание',
+            cooking_time=10,
+            image='recipe_images/test.png',
+        )
+        IngredientAmount.objects.create(
+            recipe=recipe, ingredient=self.ingredients[0], amount=1,
+        )
+        Recipe.objects.filter(pk=first.pk).delete()
+        self.assertEqual(
+            self.match(self.ingredients[0]), [(recipe.pk, 1.0)],
+        )
+
+    def test_unknown_changes_rebuild_index(self):
+        IngredientAmount.objects.filter(recipe=self.recipes[0]).delete()
+        bump_version(RECIPES_VERSION_KEY)
+        self.assertEqual(
+            self.match(self.ingredients[1]), [(self.recipes[1].pk, 0.5)],
+        )
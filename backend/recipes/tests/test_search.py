@@ -0,0 +1,89 @@
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from core.cache import bump_version
+from recipes.indexes import RECIPES_VERSION_KEY, RecipeSearchIndex
+from recipes.models import Ingredient, IngredientAmount, Recipe
+from recipes.search import search_recipes, update_search_vectors
+from users.models import User
+
+
+class SearchTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(
+            username='author', email='author@example.com',
+            first_name='Автор', last_name='Автор',
+        )
+        potato = Ingredient.objects.create(
+            name='картофель', measurement_unit='г',
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                author=author,
+                name=name,
+                text=text,
+                cooking_time=10,
+                image='recipe_images/test.png',
+            )
+            for name, text in (
+                ('Картофельное пюре', 'Сварить и размять'),
+                ('Суп', 'Нарезать картофель'),
+                ('Салат', 'Огурцы и помидоры'),
+            )
+        ]
+        IngredientAmount.objects.create(
+            recipe=cls.recipes[0], ingredient=potato, amount=1,
+        )
+
+
+class RecipeSearchIndexTest(SearchTestCase):
+    """Изменённый рецепт переиндексируется без перестройки индекса."""
+    def setUp(self):
+        cache.clear()
+        self.index = RecipeSearchIndex()
+        self.index.warm()
+
+    def test_changed_recipe_is_reindexed(self):
+        first, second, third = self.recipes
+        self.assertEqual(self.index.search('картофель'), [first.pk, second.pk])
+        Recipe.objects.filter(pk=third.pk).update(name='Салат с картофелем')
+        Recipe.objects.filter(pk=second.pk).delete()
+        bump_version(RECIPES_VERSION_KEY, [second.pk, third.pk])
+        with mock.patch.object(
+            self.index, '_build', side_effect=AssertionError,
+        ):
+            self.assertEqual(self.index.search('картофель'), [first.pk])
+            self.assertEqual(self.index.search('картофелем'), [third.pk])
+            self.assertEqual(self.index.search('огурцы'), [third.pk])
+            self.assertEqual(self.index.search('нарезать'), [])
+
+    @override_settings(INDEX_CHECK_INTERVAL=0)
+    def test_other_process_writes_are_found_by_marker(self):
+        """Версия не сменилась, как при записи из другого процесса."""
+        first, second, _ = self.recipes
+        second.name = 'Суп с картофелем'
+        second.save()
+        self.assertEqual(self.index.search('картофелем'), [second.pk])
+        Recipe.objects.filter(pk=first.pk).delete()
+        self.assertEqual(self.index.search('пюре'), [])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Нужен Postgres')
+class PostgresSearchTest(SearchTestCase):
+    """Поиск по `search_vector`: название весит больше ингредиентов."""
+    def setUp(self):
+        update_search_vectors([recipe.pk for recipe in self.recipes])
+
+    def test_search_vector(self):
+        first, second, _ = self.recipes
+        self.assertEqual(
+            list(search_recipes(
+                Recipe.objects.all(), 'картофель',
+            ).values_list('pk', flat=True)),
+            [first.pk, second.pk],
+        )
+        self.assertFalse(search_recipes(Recipe.objects.all(), 'торт'))
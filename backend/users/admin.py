@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from core.counters import CounterAdminMixin
 from users.models import Follow, User
 
 
@@ -11,6 +12,8 @@ class UserAdmin(admin.ModelAdmin):
         'email',
         'first_name',
         'last_name',
+        'recipes_count',
+        'followers_count',
     )
     list_filter = ('email', 'username')
     search_fields = ('email', 'username')
@@ -18,6 +21,9 @@ class UserAdmin(admin.ModelAdmin):
 
 
 @admin.register(Follow)
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(CounterAdminMixin, admin.ModelAdmin):
     list_display = ('id', 'user', 'author')
     search_fields = ('user__username', 'author__username')
+    counter_model = User
+    counter = 'followers_count'
+    counter_field = 'author'
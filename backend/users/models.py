@@ -6,6 +6,7 @@ from django.db.models import (
     EmailField,
     ForeignKey,
     Model,
+    PositiveIntegerField,
     UniqueConstraint,
 )
 
@@ -42,6 +43,16 @@ class User(AbstractUser):
         'Пароль',
         max_length=Limits.MAX_LEN_PASSWORD.value,
     )
+    recipes_count = PositiveIntegerField(
+        'Количество рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = PositiveIntegerField(
+        'Количество подписчиков',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         ordering = ('username',)
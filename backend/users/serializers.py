@@ -1,8 +1,10 @@
 from djoser.serializers import UserSerializer, UserCreateSerializer
 from rest_framework import serializers
 
+from api.fields import ResizedImageField
+from api.relations import get_relations
 from recipes.models import Recipe
-from users.models import User, Follow
+from users.models import User
 
 
 FIELDS_USER = (
@@ -24,15 +26,13 @@ class CustomUserCreateSerializer(UserCreateSerializer):
         extra_kwargs = {'password': {'write_only': True}}
 
     def create(self, validated_data):
-        user = User.objects.create(
+        return User.objects.create_user(
             email=validated_data['email'],
             username=validated_data['username'],
             first_name=validated_data['first_name'],
-            last_name=validated_data['last_name']
+            last_name=validated_data['last_name'],
+            password=validated_data['password'],
         )
-        user.set_password(validated_data['password'])
-        user.save()
-        return user
 
 
 class CustomUserSerializer(UserSerializer):
@@ -45,11 +45,7 @@ class CustomUserSerializer(UserSerializer):
 
     def get_is_subscribed(self, obj):
         """Подписан ли текущий пользователь на просматриваемого."""
-        user_id = self.context.get('request').user.id
-        return Follow.objects.filter(
-            author=obj.id,
-            user=user_id
-        ).exists()
+        return obj.id in get_relations(self.context.get('request')).following
 
 
 class ShortRecipeSerializer(serializers.ModelSerializer):
@@ -57,9 +53,15 @@ class ShortRecipeSerializer(serializers.ModelSerializer):
     Сериализатор для модели Recipe.
     Определён укороченный набор полей для некоторых эндпоинтов.
     """
+    image_thumbnail = ResizedImageField()
+    image_card = ResizedImageField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = (
+            'id', 'name', 'image', 'image_thumbnail', 'image_card',
+            'cooking_time',
+        )
         read_only_fields = fields
 
 
@@ -72,7 +74,7 @@ class FollowSerializer(serializers.ModelSerializer):
     last_name = serializers.ReadOnlyField(source='author.last_name')
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField(read_only=True)
+    recipes_count = serializers.ReadOnlyField(source='author.recipes_count')
 
     class Meta:
         model = User
@@ -82,20 +84,16 @@ class FollowSerializer(serializers.ModelSerializer):
             'recipes_count',
         )
 
-    def get_recipes_count(self, obj):
-        """Высчитывает количество рецептов."""
-        return obj.author.recipes.count()
-
     def get_is_subscribed(self, obj):
         """Подписан ли текущий пользователь на просматриваемого."""
-        request = self.context.get('request')
-        return (
-            request and request.user.is_authenticated
-            and request.user.follower.filter(author=obj.author).exists()
-        )
+        return obj.author_id in get_relations(
+            self.context.get('request')
+        ).following
 
     def get_recipes(self, obj):
         """Показывает рецепты пользователя."""
+        if hasattr(obj, 'author_recipes'):
+            return ShortRecipeSerializer(obj.author_recipes, many=True).data
         request = self.context.get('request')
         recipes = obj.author.recipes.all()
         recipes_limit = request.query_params.get('recipes_limit')
@@ -0,0 +1,77 @@
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.tests.caches import enable_shared_cache
+from recipes.models import Recipe
+from users.models import Follow, User
+
+AUTHORS = 4
+AUTHOR_RECIPES = 3
+
+
+class SubscriptionsQueriesTest(TestCase):
+    """
+    Число запросов страницы подписок не зависит от числа авторов
+    и `recipes_limit`.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create(
+            username='reader', email='reader@example.com',
+            first_name='Читатель', last_name='Читатель',
+        )
+        cls.authors = []
+        for number in range(AUTHORS):
+            author = User.objects.create(
+                username=f'author{number}',
+                email=f'author{number}@example.com',
+                first_name='Автор', last_name='Автор',
+            )
+            Recipe.objects.bulk_create(
+                Recipe(
+                    author=author,
+                    name=f'Рецепт {number}-{recipe}',
+                    text='Описание',
+                    cooking_time=10,
+                    image='recipe_images/test.png',
+                )
+                for recipe in range(AUTHOR_RECIPES)
+            )
+            cls.authors.append(author)
+        cls.token = Token.objects.create(user=cls.reader)
+
+    def setUp(self):
+        enable_shared_cache(self)
+        cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def get_subscriptions(self, params):
+        response = self.client.get('/api/users/subscriptions/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_queries_do_not_depend_on_authors_and_limit(self):
+        for authors in (1, AUTHORS):
+            Follow.objects.bulk_create(
+                Follow(user=self.reader, author=author)
+                for author in self.authors[:authors]
+            )
+            self.get_subscriptions({})
+            for recipes_limit in (None, 1, AUTHOR_RECIPES - 1):
+                params = {'limit': AUTHORS}
+                if recipes_limit is not None:
+                    params['recipes_limit'] = recipes_limit
+                with self.subTest(
+                    authors=authors, recipes_limit=recipes_limit,
+                ), self.assertNumQueries(3):
+                    results = self.get_subscriptions(params)
+                self.assertEqual(len(results), authors)
+                for result in results:
+                    self.assertEqual(
+                        len(result['recipes']),
+                        recipes_limit or AUTHOR_RECIPES,
+                    )
+            Follow.objects.filter(user=self.reader).delete()
@@ -1,3 +1,8 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework.decorators import action
@@ -9,7 +14,14 @@ from rest_framework.status import (
     HTTP_400_BAD_REQUEST,
 )
 
-from api.pagination import CustomPagination
+from api.pagination import (
+    CustomPagination,
+    FollowCursorPagination,
+    SwitchablePaginationMixin,
+)
+from core.counters import change_counter
+from recipes.feeds import schedule_fill_on_unfollow
+from recipes.models import FeedItem, Recipe
 from users.models import Follow, User
 from users.serializers import (
     CustomUserSerializer,
@@ -17,24 +29,68 @@ from users.serializers import (
 )
 
 
-class CustomUserViewSet(UserViewSet):
+def get_recipes_limit(request):
+    recipes_limit = request.query_params.get('recipes_limit', '')
+    return int(recipes_limit) if recipes_limit.isdigit() else None
+
+
+def attach_recipes(follows, recipes_limit=None):
+    """
+    Загружает рецепты всех авторов страницы одним запросом.
+    При `recipes_limit` первые рецепты каждого автора отбираются
+    оконной функцией ROW_NUMBER() OVER (PARTITION BY author).
+    """
+    recipes = Recipe.objects.filter(
+        author_id__in={follow.author_id for follow in follows}
+    ).only(
+        'id', 'name', 'image', 'image_thumbnail', 'image_card',
+        'cooking_time', 'author_id', 'pub_date',
+    ).order_by()
+    if recipes_limit is not None:
+        sql, params = recipes.annotate(recipe_rank=Window(
+            expression=RowNumber(),
+            partition_by=[F('author_id')],
+            order_by=F('pub_date').desc(),
+        )).query.sql_with_params()
+        recipes = Recipe.objects.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE recipe_rank <= %s '
+            'ORDER BY pub_date DESC',
+            (*params, recipes_limit),
+        )
+    else:
+        recipes = recipes.order_by('-pub_date')
+    by_author = defaultdict(list)
+    for recipe in recipes:
+        by_author[recipe.author_id].append(recipe)
+    for follow in follows:
+        follow.author_recipes = by_author[follow.author_id]
+
+
+class CustomUserViewSet(SwitchablePaginationMixin, UserViewSet):
     """
     ViewSet для работы с пользователями.
     """
     queryset = User.objects.all()
     serializer_class = CustomUserSerializer
     pagination_class = CustomPagination
+    cursor_pagination_class = None
+    read_from_replica = True
 
     @action(
         detail=False,
         methods=['get'],
-        permission_classes=(IsAuthenticated, )
+        permission_classes=(IsAuthenticated, ),
+        cursor_pagination_class=FollowCursorPagination,
     )
     def subscriptions(self, request):
-        """Список подписок пользоваетеля."""
+        """
+        Список подписок пользоваетеля.
+        Страница загружается фиксированным числом запросов.
+        """
         user = request.user
-        queryset = user.follower.all()
+        queryset = user.follower.select_related('author').order_by('id')
         pages = self.paginate_queryset(queryset)
+        attach_recipes(pages, get_recipes_limit(request))
         serializer = FollowSerializer(
             pages, many=True, context={'request': request}
         )
@@ -46,27 +102,38 @@ class CustomUserViewSet(UserViewSet):
         permission_classes=(IsAuthenticated, )
     )
     def subscribe(self, request, id):
-        """Создаёт или удаляет подписку на пользователя."""
+        """
+        Создаёт или удаляет подписку на пользователя.
+        Повторы определяются ограничением уникальности и числом
+        удалённых строк, без предварительных проверок.
+        """
         user = request.user
         author = get_object_or_404(User, id=id)
         if user == author:
             return Response(
                 {'errors': 'На себя нельзя подписаться / отписаться'},
                 status=HTTP_400_BAD_REQUEST)
-        subscription = Follow.objects.filter(
-            author=author, user=user)
         if request.method == 'POST':
-            if subscription.exists():
+            try:
+                with transaction.atomic():
+                    queryset = Follow.objects.create(author=author, user=user)
+                    change_counter(User, author.pk, 'followers_count')
+                    FeedItem.objects.backfill(user, author)
+            except IntegrityError:
                 return Response(
                     {'errors': 'Нельзя подписаться повторно'},
                     status=HTTP_400_BAD_REQUEST)
-            queryset = Follow.objects.create(author=author, user=user)
             serializer = FollowSerializer(
                 queryset, context={'request': request})
             return Response(serializer.data, status=HTTP_201_CREATED)
-        if not subscription.exists():
-            return Response(
-                {'errors': 'Нельзя отписаться повторно'},
-                status=HTTP_400_BAD_REQUEST)
-        subscription.delete()
+        with transaction.atomic():
+            deleted, _ = Follow.objects.filter(
+                author=author, user=user).delete()
+            if not deleted:
+                return Response(
+                    {'errors': 'Нельзя отписаться повторно'},
+                    status=HTTP_400_BAD_REQUEST)
+            change_counter(User, author.pk, 'followers_count', -1)
+            FeedItem.objects.prune(user, author)
+            schedule_fill_on_unfollow(author.pk)
         return Response(status=HTTP_204_NO_CONTENT)